@@ -0,0 +1,105 @@
+import os
+import subprocess
+import wave
+from array import array
+
+RATE = 44100 # samples per second, 16 bit signed mono throughout
+TONE = 440   # Hz of the square wave
+VOLUME = 0.25
+
+# long lived player reading raw samples from a pipe
+PLAYER = ['aplay', '-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', '{rate}']
+
+def square(tone=TONE, rate=RATE, volume=VOLUME):
+    # one second of a square wave, loops seamlessly for integer tones
+    level = int(volume * 0x7fff)
+    half = rate / tone / 2
+    return array('h', (level if int(n / half) % 2 == 0 else -level for n in range(rate))).tobytes()
+
+def load_wav(filename, rate=RATE):
+    # raw samples of a 16 bit mono WAV file, for use instead of the square wave
+    with wave.open(filename, 'rb') as f:
+        if (f.getnchannels(), f.getsampwidth(), f.getframerate()) != (1, 2, rate):
+            raise ValueError("{} is not 16 bit mono at {}Hz".format(filename, rate))
+        return f.readframes(f.getnframes())
+
+class NullSink:
+    def write(self, samples):
+        pass
+
+    def close(self):
+        pass
+
+class WavSink:
+    # records everything played, silence included, one frame of samples per
+    # emulated frame, so files line up with the run exactly
+    def __init__(self, filename, rate=RATE):
+        self.file = wave.open(filename, 'wb')
+        self.file.setnchannels(1)
+        self.file.setsampwidth(2)
+        self.file.setframerate(rate)
+
+    def write(self, samples):
+        self.file.writeframesraw(samples)
+
+    def close(self):
+        self.file.close()
+
+class PipeSink:
+    # streams to one player process for the whole run, writes never block,
+    # when the player can't keep up, e.g. without pacing, frames are dropped
+    def __init__(self, command=PLAYER, rate=RATE):
+        self.player = subprocess.Popen([arg.format(rate=rate) for arg in command],
+                                       stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.fd = self.player.stdin.fileno()
+        os.set_blocking(self.fd, False)
+        self.pending = b''
+
+    def write(self, samples):
+        if self.player is None:
+            return
+        data = self.pending or samples # finish a partly written frame first
+        try:
+            written = os.write(self.fd, data)
+        except BlockingIOError:
+            written = 0
+        except BrokenPipeError: # the player is gone, carry on silently
+            self.close()
+            return
+        self.pending = data[written:]
+
+    def close(self):
+        if self.player is None:
+            return
+        try:
+            self.player.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.player.wait()
+        self.player = None
+
+class Audio:
+    # one frame of samples per emulated frame, the tone while the sound timer
+    # is running and silence otherwise, the phase carries over between frames,
+    # frame_rate is the machine's, frames per second
+    def __init__(self, sink, frame_rate, tone=None, rate=RATE):
+        self.sink = sink
+        self.tone = tone if tone is not None else square(rate=rate)
+        self.size = rate // frame_rate * 2 # bytes per frame
+        self.silence = bytes(self.size)
+        self.pos = 0
+
+    def frame(self, on):
+        if not on:
+            self.sink.write(self.silence)
+            return
+        end = self.pos + self.size
+        samples = self.tone[self.pos:end]
+        while len(samples) < self.size: # wrap around the end of the tone
+            end = self.size - len(samples)
+            samples += self.tone[:end]
+        self.pos = end % len(self.tone)
+        self.sink.write(samples)
+
+    def close(self):
+        self.sink.close()
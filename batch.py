@@ -0,0 +1,104 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from emu import Chip8, IPF
+from ui import NullUI
+
+@lru_cache(maxsize=None)
+def read_rom(filename):
+    # every worker reads each ROM once
+    with open(filename, 'rb') as f:
+        return f.read()
+
+def run(job):
+    filename, seed, cycles, ipf, translate = job
+    chip8 = Chip8(read_rom(filename), NullUI(), paced=False, ipf=ipf, translate=translate, seed=seed)
+
+    reason = "cycles"
+    error = None
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while chip8.cycles < cycles:
+            if not chip8.frame():
+                reason = "terminated"
+                break
+            frames += 1
+    except Exception as e: # a crashing ROM is a result too
+        reason = "error"
+        error = "{}: {}".format(type(e).__name__, e)
+    elapsed = time.perf_counter() - start
+
+    return {'rom': filename,
+            'seed': seed,
+            'reason': reason,
+            'error': error,
+            'cycles': chip8.cycles,
+            'frames': frames,
+            'pc': chip8.pc,
+            'i': chip8.i,
+            'sp': chip8.sp,
+            'v': list(chip8.v),
+            'delay_timer': chip8.delay_timer,
+            'sound_timer': chip8.sound_timer,
+            'screen': hashlib.sha1(chip8.screen.buffer).hexdigest(),
+            'seconds': round(elapsed, 6)}
+
+def parse_seeds(text):
+    # "7", "1,2,5" or an inclusive range like "0..999"
+    seeds = []
+    for part in text.split(','):
+        if '..' in part:
+            first, last = part.split('..')
+            seeds.extend(range(int(first), int(last)+1))
+        else:
+            seeds.append(int(part))
+    return seeds
+
+def parse_workers(text):
+    if text == 'auto':
+        return os.cpu_count() or 1
+    return int(text)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run many ROMs and seeds headless, in parallel.')
+    parser.add_argument('roms', nargs='+', metavar='ROM')
+    parser.add_argument('--seeds', help='Seeds to run every ROM with, like 0..999 or 1,2,5 (default 0).',
+                        type=parse_seeds, default=[0])
+    parser.add_argument('--cycles', help='Instructions per run, rounded up to whole frames (default 100000).',
+                        type=int, default=100000, metavar='N')
+    parser.add_argument('--ipf', help='Instructions per 60Hz frame (default {}).'.format(IPF),
+                        type=int, default=IPF, metavar='N')
+    parser.add_argument('--translate', help='Compile ROM code into cached python blocks.', action='store_true')
+    parser.add_argument('--workers', help='Worker processes, or auto for one per core (default auto).',
+                        type=parse_workers, default='auto')
+    args = parser.parse_args()
+
+    jobs = [(rom, seed, args.cycles, args.ipf, args.translate) for rom in args.roms for seed in args.seeds]
+    chunksize = max(1, len(jobs) // (args.workers * 16))
+
+    reasons = Counter()
+    instructions = 0
+    busy = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as executor:
+        for result in executor.map(run, jobs, chunksize=chunksize):
+            print(json.dumps(result), flush=True)
+            reasons[result['reason']] += 1
+            instructions += result['cycles']
+            busy += result['seconds']
+    elapsed = time.perf_counter() - start
+
+    print("{} runs on {} workers in {:.3f}s ({})".format(
+        len(jobs), args.workers, elapsed, ", ".join("{} {}".format(n, r) for r, n in sorted(reasons.items()))),
+        file=sys.stderr)
+    print("{} instructions, {:.0f} instructions per second overall, {:.0f} per worker".format(
+        instructions, instructions / elapsed if elapsed else 0, instructions / busy if busy else 0),
+        file=sys.stderr)
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from emu import Chip8, IPF
+from ui import NullUI
+
+def rom(*words):
+    return b''.join(word.to_bytes(2, 'big') for word in words)
+
+# synthetic ROMs, each one an endless loop over one family of handlers
+SYNTHETIC = {
+        'alu': rom(0x6001, 0x6103,                         # 0x200 mov V0,1; mov V1,3
+                   0x8014, 0x8015, 0x8106, 0x810e, 0x8017, # 0x204 add, sub, shr, shl, rsb
+                   0x8011, 0x8012, 0x8013, 0x8010, 0x7105, # 0x20e or, and, xor, mov, add V1,5
+                   0x1204),                                # 0x218 jmp 0x204
+        'skip': rom(0x6000, 0x6101,                        # 0x200 mov V0,0; mov V1,1
+                    0x3000, 0x7201, 0x4001, 0x7201,        # 0x204 skeq/skne VX,RR
+                    0x5010, 0x7201, 0x9010, 0x7201,        # 0x20c skeq/skne VX,VY
+                    0xe09e, 0x7201, 0xe0a1, 0x7201,        # 0x214 skpr/skup
+                    0x1204),                               # 0x21c jmp 0x204
+        'sprite': rom(0x6000, 0x6100, 0x6200,              # 0x200 mov V0,0; mov V1,0; mov V2,0
+                      0xf229, 0xd015,                      # 0x206 font V2; sprite V0,V1,5
+                      0x7003, 0x7102, 0x7201,              # 0x20a move and next digit
+                      0x1206),                             # 0x210 jmp 0x206
+        'memory': rom(0x6a05,                              # 0x200 mov VA,5
+                      0xa300, 0xf755, 0xf765, 0xfa33,      # 0x202 mvi 0x300; str; ldr; bcd
+                      0x7a01, 0x1202),                     # 0x20a add VA,1; jmp 0x202
+        'call': rom(0x2206, 0x1200, 0x0000,                # 0x200 jsr 0x206; jmp 0x200
+                    0x220a, 0x00ee,                        # 0x206 jsr 0x20a; rts
+                    0x7001, 0x00ee),                       # 0x20a add V0,1; rts
+        }
+
+def load_cases():
+    cases = dict(SYNTHETIC)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'roms', 'breakout.rom'), 'rb') as f:
+        cases['breakout'] = f.read()
+    return cases
+
+def execute(code, cycles, translate):
+    chip8 = Chip8(code, NullUI(), paced=False, ipf=IPF, translate=translate, seed=0)
+    while chip8.cycles < cycles and chip8.frame():
+        pass
+    return chip8.cycles
+
+def measure(code, cycles, translate, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        executed = execute(code, cycles, translate)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # allocations are traced in a separate, shorter run, tracing is slow
+    tracemalloc.start()
+    execute(code, max(cycles // 10, IPF), translate)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'cycles': executed,
+            'ips': executed / best,
+            'ns_per_op': best * 1e9 / executed,
+            'peak_kb': peak / 1024}
+
+def compare(results, baseline, threshold):
+    # names of benchmarks more than threshold slower than the baseline
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result['ips'] < baseline[name]['ips'] * (1 - threshold):
+            regressions.append(name)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the emulator core, headless.')
+    parser.add_argument('cases', nargs='*', metavar='CASE',
+                        help='Benchmarks to run, out of {} (default all).'.format(", ".join(list(SYNTHETIC) + ['breakout'])))
+    parser.add_argument('--cycles', help='Instructions per run (default 200000).', type=int, default=200000, metavar='N')
+    parser.add_argument('--repeat', help='Runs per benchmark, the fastest counts (default 3).', type=int, default=3)
+    parser.add_argument('--out', help='Write results as JSON to FILE.', metavar='FILE')
+    parser.add_argument('--baseline', help='Compare against results stored in FILE.', metavar='FILE')
+    parser.add_argument('--threshold', help='Allowed slowdown against the baseline (default 0.1).',
+                        type=float, default=0.1)
+    args = parser.parse_args()
+
+    cases = load_cases()
+    names = args.cases or list(cases)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    print("{:<22}{:>14}{:>12}{:>12}{:>10}".format("benchmark", "instr/s", "ns/op", "peak KiB", "change"))
+    for name in names:
+        for translate in (False, True):
+            key = "{}/{}".format(name, "translate" if translate else "interpret")
+            result = results[key] = measure(cases[name], args.cycles, translate, args.repeat)
+            change = ""
+            if key in baseline:
+                change = "{:+.1%}".format(result['ips'] / baseline[key]['ips'] - 1)
+            print("{:<22}{:>14.0f}{:>12.1f}{:>12.1f}{:>10}".format(
+                key, result['ips'], result['ns_per_op'], result['peak_kb'], change), flush=True)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'cycles': args.cycles,
+                       'results': results}, f, indent=2)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("slower than baseline by more than {:.0%}: {}".format(args.threshold, ", ".join(regressions)),
+              file=sys.stderr)
+        sys.exit(1)
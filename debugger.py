@@ -0,0 +1,285 @@
+import re
+
+STEP_FRAMES = 60 # frames run by the 'frames' command
+
+# handlers that may write the registers a watch or condition refers to
+V_WRITERS = {'load_const', 'add_const', 'load_reg', 'or_reg', 'and_reg', 'xor_reg', 'add_reg', 'sub_reg',
+             'shift_right', 'shift_left', 'sub_reg_reverse', 'load_random', 'draw_sprite', 'get_delay',
+             'wait_key', 'load_reg_from_mem'}
+FLAG_WRITERS = {'add_reg', 'sub_reg', 'shift_right', 'shift_left', 'sub_reg_reverse', 'draw_sprite'}
+I_WRITERS = {'load_const_i', 'add_to_i', 'set_char'}
+TIMER_WRITERS = {'set_delay_timer', 'set_sound_timer'} # timers also change once per frame
+MEMORY_WRITERS = {'put_bcd': lambda chip8, x: 3,
+                  'store_reg_to_mem': lambda chip8, x: x + 1} # bytes written from I on
+
+# what a wrapped table entry checks, bits of an int
+BREAK = 1   # before: breakpoints and the step over return address
+STEP = 2    # after: always stop
+VALUES = 4  # after: watched registers and conditions
+MEMORY = 8  # after: memory watches and writes over breakpoints
+RETURN = 16 # after: step out of a subroutine
+
+# names usable in conditions
+NAMES = {'I': 'c.i', 'PC': 'c.pc', 'SP': 'c.sp', 'DT': 'c.delay_timer', 'ST': 'c.sound_timer'}
+TOKEN = re.compile(r'\b([Vv][0-9A-Fa-f]|I|PC|SP|DT|ST)\b')
+ATTRIBUTES = {name[2:] for name in NAMES.values()} # all a compiled condition may look up
+
+def looked_up(code):
+    # every global and attribute name a code object and the ones nested in it use
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, 'co_names'):
+            names |= looked_up(const)
+    return names
+
+class Condition:
+    # a python comparison over V0-VF, I, PC, SP, DT and ST, e.g. 'V3 == 0x10'
+    def __init__(self, text):
+        self.text = text
+        self.names = {name.upper() for name in TOKEN.findall(text)}
+        source = TOKEN.sub(lambda m: NAMES.get(m.group(1)) or "v[0x{}]".format(m.group(1)[1]), text)
+        try:
+            self.test = eval("lambda c, v: ({})".format(source), {'__builtins__': {}})
+        except SyntaxError:
+            raise ValueError("bad condition '{}'".format(text))
+        unknown = looked_up(self.test.__code__) - ATTRIBUTES
+        if unknown: # would only fail once the condition is first checked, mid run
+            raise ValueError("unknown name {} in condition '{}'".format(", ".join(sorted(unknown)), text))
+        self.last = False # conditions without an address break when they become true
+
+    def __call__(self, chip8):
+        return bool(self.test(chip8, chip8.v))
+
+def written(name, opcode):
+    # the V registers an instruction of a V_WRITERS handler writes
+    x = (opcode & 0x0f00) >> 8
+    if name == 'load_reg_from_mem':
+        return set(range(x+1))
+    if name in FLAG_WRITERS:
+        return {x, 0xf}
+    return {x}
+
+def parse_address(text):
+    return int(text, 0)
+
+def parse_watch(text):
+    # 'V3', 'I', 'DT', 'ST', an address or an inclusive range like '0x300-0x30f'
+    if TOKEN.fullmatch(text.strip()):
+        return text.strip().upper()
+    start, _, end = text.partition('-')
+    return range(parse_address(start), parse_address(end or start) + 1)
+
+class Debugger:
+    # breakpoints, watchpoints and stepping for a machine, all checks are
+    # compiled into a copy of the dispatch table, only handlers that can hit
+    # a check get a wrapper, everything else runs plain, like the profiler
+    def __init__(self, chip8, on_stop=None, frames=STEP_FRAMES):
+        self.chip8 = chip8
+        self.on_stop = on_stop # called with (debugger, reason), returns a command, default asks the ui
+        self.frames = frames
+        self.breakpoints = {} # address -> Condition or None
+        self.watches = []     # register names and memory ranges
+        self.conditions = []  # Conditions without an address
+        self.mode = 'step'
+        self.until = None     # (address, sp) to stop at, for step over
+        self.out_sp = None    # stop once a return brings sp below this
+        self.frames_left = None
+        self.next_pc = None   # where the machine is stopped
+        self.saved = None
+
+    def add_break(self, address, condition=None):
+        self.breakpoints[address] = Condition(condition) if condition else None
+        self.compile()
+
+    def add_watch(self, what):
+        self.watches.append(what)
+        self.compile()
+
+    def add_condition(self, text):
+        self.conditions.append(Condition(text))
+        self.compile()
+
+    def parse(self, text):
+        # 'ADDR [if COND]' is a breakpoint, a bare condition breaks when it
+        # becomes true
+        address, _, condition = text.partition(' if ')
+        try:
+            address = parse_address(address)
+        except ValueError:
+            self.add_condition(text)
+        else:
+            self.add_break(address, condition.strip() or None)
+
+    def attach(self, mode='step'):
+        chip8 = self.chip8
+        self.saved = chip8.table, chip8.blocks, chip8.debug
+        chip8.blocks = None # translated blocks would bypass the table
+        chip8.debug = True
+        chip8.frame_hooks.append(self.frame)
+        self.mode = mode
+        self.compile()
+
+    def detach(self):
+        chip8 = self.chip8
+        chip8.table, chip8.blocks, chip8.debug = self.saved
+        if chip8.blocks is not None:
+            chip8.blocks.clear() # it missed the writes made while we were attached
+        chip8.frame_hooks.remove(self.frame)
+        self.saved = None
+
+    def compile(self):
+        # rebuild the instrumented table for the current mode and checks
+        if self.saved is None:
+            return
+        chip8 = self.chip8
+        memory = chip8.memory
+        names = set(name for name in self.watches if isinstance(name, str))
+        for condition in self.conditions:
+            names |= condition.names
+        everything = self.mode == 'step' or 'PC' in names or 'SP' in names
+        registers = {int(name[1], 16) for name in names if name.startswith('V')}
+
+        kinds = {}
+        for _, op_func in chip8.op_map.values():
+            name = op_func.__name__
+            kind = 0
+            if everything:
+                kind |= STEP if self.mode == 'step' else VALUES
+            if 'I' in names and name in I_WRITERS or names & {'DT', 'ST'} and name in TIMER_WRITERS:
+                kind |= VALUES
+            if name in MEMORY_WRITERS and (self.breakpoints or any(isinstance(w, range) for w in self.watches)):
+                kind |= MEMORY
+            if self.out_sp is not None and name == 'return_from_subroutine':
+                kind |= RETURN
+            kinds[op_func] = kind
+
+        addresses = set(self.breakpoints) if self.mode != 'step' else set()
+        if self.until:
+            addresses.add(self.until[0])
+        stops = {memory[a] << 8 | memory[(a+1) % len(memory)] for a in addresses}
+
+        # wrap the table we found on attach, which may be instrumented
+        # already, decode_table only tells which handler an entry runs
+        base = self.saved[0]
+        wrappers = {}
+        table = []
+        for opcode, (op_func, _) in enumerate(chip8.decode_table):
+            entry = base[opcode]
+            if op_func is None:
+                table.append(entry)
+                continue
+            kind = kinds[op_func] | (BREAK if opcode in stops else 0)
+            if registers and op_func.__name__ in V_WRITERS and registers & written(op_func.__name__, opcode):
+                kind |= VALUES
+            if not kind:
+                table.append(entry)
+                continue
+            handler, args = entry
+            if (handler, kind) not in wrappers:
+                wrappers[handler, kind] = self.wrap(handler, op_func.__name__, kind)
+            table.append((wrappers[handler, kind], args))
+        chip8.table = table
+        self.values = self.read_values()
+
+    def read_values(self):
+        chip8 = self.chip8
+        return [getattr(chip8, NAMES[name][2:]) if name in NAMES else chip8.v[int(name[1], 16)]
+                for name in self.watches if isinstance(name, str)]
+
+    def wrap(self, op_func, name, kind):
+        writes = MEMORY_WRITERS.get(name)
+
+        def checked(chip8, *args):
+            if kind & BREAK:
+                reason = self.check_break(chip8)
+                if reason:
+                    self.stop(reason, chip8.pc - 2)
+            i = chip8.i
+            op_func(chip8, *args)
+            reasons = []
+            if kind & STEP:
+                reasons.append("step")
+            if kind & VALUES:
+                reasons.extend(self.check_values(chip8))
+            if kind & MEMORY:
+                reasons.extend(self.check_memory(chip8, i, i + writes(chip8, *args)))
+            if kind & RETURN and self.out_sp is not None and chip8.sp < self.out_sp:
+                reasons.append("returned")
+            if reasons:
+                self.stop(", ".join(reasons), chip8.pc)
+        return checked
+
+    def check_break(self, chip8):
+        pc = chip8.pc - 2
+        if self.until and self.until == (pc, chip8.sp):
+            return "stepped over"
+        if pc in self.breakpoints:
+            condition = self.breakpoints[pc]
+            if condition is None or condition(chip8):
+                return "break 0x{:03X}".format(pc)
+        return None
+
+    def check_values(self, chip8):
+        reasons = []
+        values = self.read_values()
+        names = [name for name in self.watches if isinstance(name, str)]
+        for name, old, new in zip(names, self.values, values):
+            if old != new:
+                reasons.append("{} 0x{:02X}".format(name, new))
+        self.values = values
+        for condition in self.conditions:
+            state = condition(chip8)
+            if state and not condition.last:
+                reasons.append(condition.text)
+            condition.last = state
+        return reasons
+
+    def check_memory(self, chip8, start, end):
+        reasons = []
+        for watch in self.watches:
+            if isinstance(watch, range) and start < watch.stop and watch.start < end:
+                reasons.append("write 0x{:03X}".format(max(start, watch.start)))
+        if any(start <= a + 1 and a < end for a in self.breakpoints):
+            self.compile() # code under a breakpoint changed, find it by its new opcode
+        return reasons
+
+    def frame(self):
+        reasons = []
+        if self.conditions or any(name in ('DT', 'ST') for name in self.watches):
+            reasons.extend(self.check_values(self.chip8))
+        if self.frames_left is not None:
+            self.frames_left -= 1
+            if not self.frames_left:
+                reasons.append("{} frames".format(self.frames))
+        if reasons:
+            self.stop(", ".join(reasons), self.chip8.pc)
+
+    def stop(self, reason, next_pc):
+        # show the machine and wait for a command, next_pc is the address of
+        # the instruction that runs next
+        chip8 = self.chip8
+        self.next_pc = next_pc
+        self.until = self.out_sp = self.frames_left = None
+        if self.on_stop:
+            command = self.on_stop(self, reason)
+        else:
+            chip8.ui.update_var_window(chip8)
+            chip8.ui.screen_redraw(chip8.screen)
+            command = chip8.ui.wait_command(reason)
+
+        self.mode = 'run'
+        if command == 'step':
+            self.mode = 'step'
+        elif command == 'over':
+            if chip8.memory[next_pc] & 0xf0 == 0x20: # jsr, run until it returns here
+                self.until = (next_pc + 2, chip8.sp)
+            else:
+                self.mode = 'step'
+        elif command == 'out':
+            if chip8.sp:
+                self.out_sp = chip8.sp
+            else:
+                self.mode = 'step'
+        elif command == 'frames':
+            self.frames_left = self.frames
+        self.compile()
@@ -1,270 +1,340 @@
-import subprocess
 import sys
 import random
+from array import array
+import string
 import time
 
 import curses
 
-from ui import CursesUI
+import audio
+import savestate
+from framebuffer import Framebuffer
+from debugger import Debugger, parse_watch, STEP_FRAMES
+from profiler import Profiler
+from recording import Recorder
+from translate import BlockCache
+from ui import CursesUI, NullUI, ThreadedUI, KEY_HOLD, REFRESH_RATE
+
+FRAME_RATE = 60 # timers and the display run at 60Hz
+IPF = 10        # default instructions per frame
+MAX_LAG = 5     # frames the scheduler may fall behind before dropping them
+
+MEMORY_SIZE = 4096 # 4kB of memory
+PROGRAM_START = 0x200
+
+# decode table entry for opcodes without a handler, cycle() terminates on it
+TERMINATE = (None, ())
+
+def operands(opcode):
+    return {'x': (opcode & 0x0f00) >> 8,
+            'y': (opcode & 0x00f0) >> 4,
+            'n': opcode & 0x000f,
+            'nn': opcode & 0x00ff,
+            'nnn': opcode & 0x0fff}
+
+def build_decode_table(op_map):
+    table = [TERMINATE] * 0x10000
+    fields = string.Formatter()
+    for opcode in range(0x10000):
+        mask = 0xf000 # the first nibble is enough most of the time
+
+        # extend the mask if necessary
+        if opcode & 0xf000 == 0x8000:
+            mask = 0xf00f
+        elif opcode & 0xf000 in (0x0000, 0xe000, 0xf000):
+            mask = 0xf0ff
+
+        try:
+            op_str, op_func = op_map[opcode & mask]
+        except KeyError:
+            continue
+
+        values = operands(opcode)
+        args = tuple(values[name] for _, name, _, _ in fields.parse(op_str) if name)
+        table[opcode] = (op_func, args)
+    return table
+
+FONT = bytes([
+    0xF0, 0x90, 0x90, 0x90, 0xF0, # 0
+    0x20, 0x60, 0x20, 0x20, 0x70, # 1
+    0xF0, 0x10, 0xF0, 0x80, 0xF0, # 2
+    0xF0, 0x10, 0xF0, 0x10, 0xF0, # 3
+    0x90, 0x90, 0xF0, 0x10, 0x10, # 4
+    0xF0, 0x80, 0xF0, 0x10, 0xF0, # 5
+    0xF0, 0x80, 0xF0, 0x90, 0xF0, # 6
+    0xF0, 0x10, 0x20, 0x40, 0x40, # 7
+    0xF0, 0x90, 0xF0, 0x90, 0xF0, # 8
+    0xF0, 0x90, 0xF0, 0x10, 0xF0, # 9
+    0xF0, 0x90, 0xF0, 0x90, 0x90, # A
+    0xE0, 0x90, 0xE0, 0x90, 0xE0, # B
+    0xF0, 0x80, 0x80, 0x80, 0xF0, # C
+    0xE0, 0x90, 0x90, 0x90, 0xE0, # D
+    0xF0, 0x80, 0xF0, 0x80, 0xF0, # E
+    0xF0, 0x80, 0xF0, 0x80, 0x80]) # F
 
 class Chip8:
-    pc = 0     # program counter
-    opcode = 0 # current opcode
-    sp = 0     # stack pointer
-
-    stack = [0]*16    # 16 bytes of stack
-    i = 0             # one special index register
-    v = [0]*16        # 16 byte-size registers, called V
-    memory = [0]*4096 # 4kB of memory
-    memory[0:80] = [
-        0xF0, 0x90, 0x90, 0x90, 0xF0, # 0
-        0x20, 0x60, 0x20, 0x20, 0x70, # 1
-        0xF0, 0x10, 0xF0, 0x80, 0xF0, # 2
-        0xF0, 0x10, 0xF0, 0x10, 0xF0, # 3
-        0x90, 0x90, 0xF0, 0x10, 0x10, # 4
-        0xF0, 0x80, 0xF0, 0x10, 0xF0, # 5
-        0xF0, 0x80, 0xF0, 0x90, 0xF0, # 6
-        0xF0, 0x10, 0x20, 0x40, 0x40, # 7
-        0xF0, 0x90, 0xF0, 0x90, 0xF0, # 8
-        0xF0, 0x90, 0xF0, 0x10, 0xF0, # 9
-        0xF0, 0x90, 0xF0, 0x90, 0x90, # A
-        0xE0, 0x90, 0xE0, 0x90, 0xE0, # B
-        0xF0, 0x80, 0x80, 0x80, 0xF0, # C
-        0xE0, 0x90, 0x90, 0x90, 0xE0, # D
-        0xF0, 0x80, 0xF0, 0x80, 0xF0, # E
-        0xF0, 0x80, 0xF0, 0x80, 0x80] # F
-
-    # 60Hz countdown timers
-    delay_timer = 0
-    sound_timer = 0
-    cycles = 0
-
-    def __init__(self, filename, ui, debug=False):
-        self.debug = debug
+    __slots__ = ('pc',          # program counter
+                 'opcode',      # current opcode
+                 'sp',          # stack pointer
+                 'stack',       # 16 entries of stack
+                 'i',           # one special index register
+                 'v',           # 16 byte-size registers, called V
+                 'memory',      # 4kB of memory
+                 'delay_timer', # 60Hz countdown timers
+                 'sound_timer',
+                 'cycles',      # instructions executed since reset
+                 'rng',         # per machine random source, seedable
+                 'audio',       # sound output, None for silence
+                 'rom', 'screen', 'ui', 'debug', 'paced', 'ipf', 'turbo', 'blocks', 'disassembly',
+                 'frame_hooks', # called without arguments after every frame
+                 'table',       # opcode dispatch, decode_table unless instrumented
+                 'idle')        # seconds spent sleeping in run()
+
+    def __init__(self, rom, ui, debug=False, paced=True, ipf=IPF, turbo=1, translate=False, seed=None,
+                 audio=None):
+        self.audio = audio
+        self.debug = debug # a debugger is attached, see debugger.py
+        self.paced = paced # keep to real time, or run as fast as possible
+        self.ipf = ipf
+        self.turbo = turbo # real time multiplier when paced
+        self.blocks = BlockCache(self) if translate and not debug else None
+        self.disassembly = {}
+        self.rng = random.Random(seed)
+        self.frame_hooks = []
+        self.table = self.decode_table
+        self.idle = 0
+        self.screen = Framebuffer()
         self.ui = ui
-        self.pc = 0x200
-        with open(filename, 'rb') as f:
-            self.memory[0x200:] = f.read(4096)
-        while len(self.memory) < 4096:
-            self.memory.append(0)
+        self.ui.disassemble = self.disassemble
+
+        self.memory = bytearray(MEMORY_SIZE)
+        self.v = bytearray(16)
+        self.stack = array('H', bytes(32))
+
+        if isinstance(rom, str): # a filename, otherwise the ROM contents
+            with open(rom, 'rb') as f:
+                rom = f.read()
+        self.load(rom)
+
+    def load(self, rom):
+        self.rom = bytes(rom[:MEMORY_SIZE-PROGRAM_START])
+        self.reset()
+
+    def reset(self):
+        # back to power-on state, reusing all buffers
+        self.memory[:len(FONT)] = FONT
+        self.memory[len(FONT):] = bytes(MEMORY_SIZE-len(FONT))
+        self.memory[PROGRAM_START:PROGRAM_START+len(self.rom)] = self.rom
+        self.v[:] = bytes(16)
+        self.stack[:] = array('H', bytes(32))
+        self.pc = PROGRAM_START
+        self.opcode = 0
+        self.sp = 0
+        self.i = 0
+        self.delay_timer = 0
+        self.sound_timer = 0
+        self.cycles = 0
+        self.screen.clear()
+        if self.blocks is not None:
+            self.blocks.clear()
+
+    def snapshot(self):
+        # the whole machine as a compact, versioned binary blob
+        return savestate.snapshot(self)
+
+    def restore(self, blob):
+        savestate.restore(self, blob)
 
     def clear_screen(self): # 0x00e0 cls
-        self.ui.clear_screen()
+        self.screen.clear() # presented by tick() like any other change
 
     def return_from_subroutine(self): # 0x00ee rts
         self.sp -= 1
         self.pc = self.stack[self.sp]
 
-    def jump(self): # 0x1NNN jmp NNN
-        self.pc = self.opcode & 0x0fff;
-        return "jmp 0x{:03X}".format(self.opcode & 0x0fff)
+    def jump(self, nnn): # 0x1NNN jmp NNN
+        self.pc = nnn
 
-    def jump_to_subroutine(self): # 0x2NNN jsr NNN
+    def jump_to_subroutine(self, nnn): # 0x2NNN jsr NNN
         self.stack[self.sp] = self.pc
-        self.sp += 1;
-        self.pc = self.opcode & 0x0fff;
-        return "jsr 0x{:03X}".format(self.opcode & 0x0fff)
+        self.sp += 1
+        self.pc = nnn
 
-    def skip_next_eq_const(self): # 0x3XRR skeq VX,RR
-        if self.v[(self.opcode & 0x0f00) >> 8] == self.opcode & 0x00ff:
+    def skip_next_eq_const(self, x, nn): # 0x3XRR skeq VX,RR
+        if self.v[x] == nn:
             self.pc += 2
-        return "skeq V{:X},{}".format((self.opcode & 0x0f00) >> 8, self.opcode & 0x00ff)
 
-    def skip_next_ne_const(self): # 0x4XRR skne VX,RR
-        if self.v[(self.opcode & 0x0f00) >> 8] != self.opcode & 0x00ff:
+    def skip_next_ne_const(self, x, nn): # 0x4XRR skne VX,RR
+        if self.v[x] != nn:
             self.pc += 2
-        return "skne V{:X},{}".format((self.opcode & 0x0f00) >> 8, self.opcode & 0x00ff)
 
-    def skip_next_eq_reg(self): # 0x5XY0 skeq VX,VY
-        if self.v[(self.opcode & 0x0f00) >> 8] == self.v[(self.opcode & 0x00f0) >> 4]:
+    def skip_next_eq_reg(self, x, y): # 0x5XY0 skeq VX,VY
+        if self.v[x] == self.v[y]:
             self.pc += 2
-        return "skeq V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def load_const(self): # 0x6XRR mov VX,RR
-        self.v[(self.opcode & 0x0f00) >> 8] = self.opcode & 0x00ff
-        return "mov V{:X},{}".format((self.opcode & 0x0f00) >> 8, self.opcode & 0x00ff)
-
-    def add_const(self): # 0x7XRR add VX,RR
-        result = self.v[(self.opcode & 0x0f00) >> 8] + self.opcode & 0x00ff
-        self.v[(self.opcode & 0x0f00) >> 8] = result & 0xffff
-        return "add V{:X},{}".format((self.opcode & 0x0f00) >> 8, self.opcode & 0x00ff)
-
-    def load_reg(self): # 0x8XY0 mov VX,VY
-        self.v[(self.opcode & 0x0f00) >> 8] = self.v[(self.opcode & 0x00f0) >> 4]
-        return "mov V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def or_reg(self): # 0x8XY1 or VX,VY
-        self.v[(self.opcode & 0x0f00) >> 8] = ( self.v[(self.opcode & 0x0f00) >> 8] |
-                                                self.v[(self.opcode & 0x00f0) >> 4] )
-        return "or V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def and_reg(self): # 0x8XY2 and VX,VY
-        self.v[(self.opcode & 0x0f00) >> 8] = ( self.v[(self.opcode & 0x0f00) >> 8] &
-                                                self.v[(self.opcode & 0x00f0) >> 4] )
-        return "and V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def xor_reg(self): # 0x8XY3 xor VX,VY
-        self.v[(self.opcode & 0x0f00) >> 8] = ( self.v[(self.opcode & 0x0f00) >> 8] ^
-                                                self.v[(self.opcode & 0x00f0) >> 4] )
-        return "xor V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def add_reg(self): # 0x8XY4 add VX,VY
-        result = self.v[(self.opcode & 0x0f00) >> 8] + self.v[(self.opcode & 0x00f0) >> 4]
-        self.v[0xf] = result & 0xf0000
-        self.v[(self.opcode & 0x0f00) >> 8] = result & 0xffff
-        return "add V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def sub_reg(self): # 0x8XY5 sub VX,VY
-        x = self.v[(self.opcode & 0x0f00) >> 8]
-        y = self.v[(self.opcode & 0x00f0) >> 4]
-        result = x - y
-        self.v[0xf] = 1 if x > y else 0
-        self.v[(self.opcode & 0x0f00) >> 8] = result & 0xff
-        return "sub V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def shift_right(self): # 0x8X06 shr VX
-        self.v[0xf] = self.v[(self.opcode & 0x0f00) >> 8] & 2**0
-        self.v[(self.opcode & 0x0f00) >> 8] = self.v[(self.opcode & 0x0f00) >> 8] >> 1
-        return "shr V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def shift_left(self): # 0x8X0e shl VX
-        self.v[0xf] = self.v[(self.opcode & 0x0f00) >> 8] & 2**15
-        self.v[(self.opcode & 0x0f00) >> 8] = (self.v[(self.opcode & 0x0f00) >> 8] << 1) & 0xffff
-        return "shl V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def sub_reg_reverse(self): # 0x8XY7 rsb VX,VY
-        x = self.v[(self.opcode & 0x0f00) >> 8]
-        y = self.v[(self.opcode & 0x00f0) >> 4]
-        result = y - x
-        self.v[0xf] = 1 if y > x else 0
-        self.v[(self.opcode & 0x0f00) >> 8] = result & 0xff
-        return "rsb V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def skip_next_ne_reg(self): # 0x9XY0 skne VX,VY
-        if self.v[(self.opcode & 0x0f00) >> 8] != self.v[(self.opcode & 0x00f0) >> 4]:
+
+    def load_const(self, x, nn): # 0x6XRR mov VX,RR
+        self.v[x] = nn
+
+    def add_const(self, x, nn): # 0x7XRR add VX,RR
+        self.v[x] = (self.v[x] + nn) & 0xff
+
+    def load_reg(self, x, y): # 0x8XY0 mov VX,VY
+        self.v[x] = self.v[y]
+
+    def or_reg(self, x, y): # 0x8XY1 or VX,VY
+        self.v[x] = self.v[x] | self.v[y]
+
+    def and_reg(self, x, y): # 0x8XY2 and VX,VY
+        self.v[x] = self.v[x] & self.v[y]
+
+    def xor_reg(self, x, y): # 0x8XY3 xor VX,VY
+        self.v[x] = self.v[x] ^ self.v[y]
+
+    def add_reg(self, x, y): # 0x8XY4 add VX,VY
+        result = self.v[x] + self.v[y]
+        self.v[0xf] = result >> 8
+        self.v[x] = result & 0xff
+
+    def sub_reg(self, x, y): # 0x8XY5 sub VX,VY
+        vx = self.v[x]
+        vy = self.v[y]
+        self.v[0xf] = 1 if vx > vy else 0
+        self.v[x] = (vx - vy) & 0xff
+
+    def shift_right(self, x): # 0x8X06 shr VX
+        self.v[0xf] = self.v[x] & 2**0
+        self.v[x] = self.v[x] >> 1
+
+    def shift_left(self, x): # 0x8X0e shl VX
+        self.v[0xf] = self.v[x] >> 7
+        self.v[x] = (self.v[x] << 1) & 0xff
+
+    def sub_reg_reverse(self, x, y): # 0x8XY7 rsb VX,VY
+        vx = self.v[x]
+        vy = self.v[y]
+        self.v[0xf] = 1 if vy > vx else 0
+        self.v[x] = (vy - vx) & 0xff
+
+    def skip_next_ne_reg(self, x, y): # 0x9XY0 skne VX,VY
+        if self.v[x] != self.v[y]:
             self.pc += 2
-        return "skne V{:X},V{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4)
-
-    def load_const_i(self): # 0xaNNN mvi NNN
-        self.i = self.opcode & 0x0fff
-        return "mvi 0x{:03X}".format(self.opcode & 0x0fff)
-
-    def jump_i(self): # 0xbNNN jmi NNN
-        self.pc = (self.opcode & 0x0fff) + self.v[0];
-        return "jmi 0x{:03X}".format(self.opcode & 0x0fff)
-
-    def load_random(self): # 0xcXKK rand VX,KK
-        self.v[(self.opcode & 0x0f00) >> 8] = random.randint(0, 2**15) & (self.opcode & 0x00ff)
-        return "rand V{:X},0x{:02X}".format((self.opcode & 0x0f00) >> 8, self.opcode & 0x00ff)
-
-    def draw_sprite(self): # 0xdXYN sprite VX,VY,N (n = 0 -> 16)
-        x = self.v[(self.opcode & 0x0f00) >> 8]
-        y = self.v[(self.opcode & 0x00f0) >> 4]
-        n = self.opcode & 0x000f
-        self.v[0x000f] = 0 # no collision, yet
-        if n == 0:
-            n = 16
-        for yline in range(n):
-            value = self.memory[self.i + yline]
-            for xline in range(8):
-                if (value & (0x80 >> xline)) != 0:
-                    if self.ui.get_pixel(x+xline, y+yline):
-                        self.v[0x000f] = 1
-                    self.ui.toggle_pixel(x+xline, y+yline)
-        return "sprite V{:X},V{:X},0x{:X}".format((self.opcode & 0x0f00) >> 8, (self.opcode & 0x00f0) >> 4, self.opcode & 0x000f)
-
-    def get_delay(self): # 0xfR07 gdelay VR
-        self.v[(self.opcode & 0x0f00) >> 8] = self.delay_timer
-        return "gdelay 0x{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def wait_key(self): # 0xfR0a key VR
-        self.v[(self.opcode & 0x0f00) >> 8] = self.ui.wait_key()
-        return "key V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def set_delay_timer(self): # 0xfR15 sdelay VR
-        self.delay_timer = self.v[(self.opcode & 0x0f00) >> 8]
-        return "sdelay V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def set_sound_timer(self): # 0xfR18 ssound VR
-        self.sound_timer = self.v[(self.opcode & 0x0f00) >> 8]
-        return "ssound V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def skip_keydown(self): # 0xeK9e skpr K
-        k = self.v[(self.opcode & 0x0f00) >> 8]
-        if self.ui.get_key(k):
+
+    def load_const_i(self, nnn): # 0xaNNN mvi NNN
+        self.i = nnn
+
+    def jump_i(self, nnn): # 0xbNNN jmi NNN
+        self.pc = nnn + self.v[0]
+
+    def load_random(self, x, nn): # 0xcXKK rand VX,KK
+        self.v[x] = self.rng.randint(0, 2**15) & nn
+
+    def draw_sprite(self, x, y, n): # 0xdXYN sprite VX,VY,N (n = 0 -> 16)
+        rows = n if n else 16
+        self.v[0xf] = self.screen.draw(self.v[x], self.v[y], self.memory[self.i:self.i+rows])
+
+    def get_delay(self, x): # 0xfR07 gdelay VR
+        self.v[x] = self.delay_timer
+
+    def wait_key(self, x): # 0xfR0a key VR
+        self.v[x] = self.ui.wait_key()
+
+    def set_delay_timer(self, x): # 0xfR15 sdelay VR
+        self.delay_timer = self.v[x]
+
+    def set_sound_timer(self, x): # 0xfR18 ssound VR
+        self.sound_timer = self.v[x]
+
+    def skip_keydown(self, x): # 0xeK9e skpr K
+        if self.ui.get_key(self.v[x]):
             self.pc += 2
-        return "skpr 0x{:X}".format((self.opcode & 0x0f00) >> 8)
 
-    def skip_keyup(self): # 0xeKa1 skup K
-        k = self.v[(self.opcode & 0x0f00) >> 8]
-        if not self.ui.get_key(k):
+    def skip_keyup(self, x): # 0xeKa1 skup K
+        if not self.ui.get_key(self.v[x]):
             self.pc += 2
-        return "skup 0x{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def add_to_i(self): # 0xfR1e adi VR
-        self.i = self.i + self.v[(self.opcode & 0x0f00) >> 8]
-        return "adi V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def set_char(self): # 0xfR29 font VR
-        r = self.v[(self.opcode & 0x0f00) >> 8]
-        self.i = r*5
-        return "font V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def put_bcd(self): # 0xfR33 bcd VR
-        self.memory[self.i] = int(self.v[((self.opcode & 0x0f00) >> 8)] / 100)
-        self.memory[self.i+1] = int((self.v[((self.opcode & 0x0f00) >> 8)] / 10) % 10)
-        self.memory[self.i+2] = int((self.v[((self.opcode & 0x0f00) >> 8)] % 100) % 10)
-        return "bcd V{:X}".format((self.opcode & 0x0f00) >> 8)
-
-    def store_reg_to_mem(self): # 0xfR55 str V0-VR
-        r = (self.opcode & 0x0f00) >> 8
-        for reg in range(r+1):
+
+    def add_to_i(self, x): # 0xfR1e adi VR
+        self.i = self.i + self.v[x]
+
+    def set_char(self, x): # 0xfR29 font VR
+        self.i = self.v[x]*5
+
+    def put_bcd(self, x): # 0xfR33 bcd VR
+        r = self.v[x]
+        self.memory[self.i] = int(r / 100)
+        self.memory[self.i+1] = int((r / 10) % 10)
+        self.memory[self.i+2] = int((r % 100) % 10)
+        if self.blocks is not None:
+            self.blocks.invalidate(self.i, self.i+3)
+
+    def store_reg_to_mem(self, x): # 0xfR55 str V0-VR
+        for reg in range(x+1):
             self.memory[self.i+reg] = self.v[reg]
-        return "str V{:X}".format((self.opcode & 0x0f00) >> 8)
+        if self.blocks is not None:
+            self.blocks.invalidate(self.i, self.i+x+1)
 
-    def load_reg_from_mem(self): # 0xfR65 ldr V0-VR
-        r = (self.opcode & 0x0f00) >> 8
-        for reg in range(r+1):
+    def load_reg_from_mem(self, x): # 0xfR65 ldr V0-VR
+        for reg in range(x+1):
             self.v[reg] = self.memory[self.i+reg]
-        return "ldr V{:X}".format((self.opcode & 0x0f00) >> 8)
 
+    # each entry maps a masked opcode to its mnemonic and handler, the operand
+    # fields named in the mnemonic are the arguments the handler is called with
     op_map = {
-            0x00e0: ("cls", clear_screen),              # 0x00e0 cls
-            0x00ee: ("rts", return_from_subroutine),    # 0x00ee rts
-            0x1000: ("jmp NNN", jump),                  # 0x1NNN jmp NNN
-            0x2000: ("jsr NNN", jump_to_subroutine),    # 0x2NNN jsr NNN
-            0x3000: ("skeq VX,RR", skip_next_eq_const), # 0x3XRR skeq VX,RR
-            0x4000: ("skne VX,RR", skip_next_ne_const), # 0x4XRR skne VX,RR
-            0x5000: ("skeq VX,VY", skip_next_eq_reg),   # 0x5XY0 skeq VX,VY
-            0x6000: ("mov VX,RR", load_const),          # 0x6XRR mov VX,RR
-            0x7000: ("add VX,RR", add_const),           # 0x7XRR add VX,RR
-            0x8000: ("mov VX,VY", load_reg),            # 0x8XY0 mov VX,VY
-            0x8001: ("or VX,VY", or_reg),               # 0x8XY1 or VX,VY
-            0x8002: ("and VX,VY", and_reg),             # 0x8XY2 and VX,VY
-            0x8003: ("xor VX,VY", xor_reg),             # 0x8XY3 xor VX,VY
-            0x8004: ("add VX,VY", add_reg),             # 0x8XY4 add VX,VY
-            0x8005: ("sub VX,VY", sub_reg),             # 0x8XY5 sub VX,VY
-            0x8006: ("shr VX", shift_right),            # 0x8X06 shr VX
-            0x8007: ("rsb VX,VY", sub_reg_reverse),     # 0x8XY7 rsb VX,VY
-            0x800e: ("shl VX", shift_left),             # 0x8X0e shl VX
-            0x9000: ("skne VX,VY", skip_next_ne_reg),   # 0x9XY0 skne VX,VY
-            0xa000: ("mvi NNN", load_const_i),          # 0xaNNN mvi NNN
-            0xb000: ("jmi NNN", jump_i),                # 0xbNNN jmi NNN
-            0xc000: ("rand VX,KK", load_random),        # 0xcXKK rand VX,KK
-            0xd000: ("sprite VX,VY,N", draw_sprite),    # 0xdXYN sprite VX,VY,N
-            0xe09e: ("skpr K", skip_keydown),           # 0xeK9e skpr K
-            0xe0a1: ("skup K", skip_keyup),             # 0xeKa1 skup K
-            0xf007: ("gdelay VR", get_delay),           # 0xfR07 gdelay VR
-            0xf00a: ("key VR", wait_key),               # 0xfR0a key VR
-            0xf015: ("sdelay VR", set_delay_timer),     # 0xfR15 sdelay VR
-            0xf018: ("ssound VR", set_sound_timer),     # 0xfR18 ssound VR
-            0xf01e: ("adi VR", add_to_i),               # 0xfR1e adi VR
-            0xf029: ("font VR", set_char),              # 0xfR29 font VR
-            0xf033: ("bcd VR", put_bcd),                # 0xfR33 bcd VR
-            0xf055: ("str V0-VR", store_reg_to_mem),    # 0xfR55 str V0-VR
-            0xf065: ("ldr V0-VR", load_reg_from_mem),   # 0xfR65 ldr V0-VR
+            0x00e0: ("cls", clear_screen),                                # 0x00e0 cls
+            0x00ee: ("rts", return_from_subroutine),                      # 0x00ee rts
+            0x1000: ("jmp 0x{nnn:03X}", jump),                            # 0x1NNN jmp NNN
+            0x2000: ("jsr 0x{nnn:03X}", jump_to_subroutine),              # 0x2NNN jsr NNN
+            0x3000: ("skeq V{x:X},{nn}", skip_next_eq_const),             # 0x3XRR skeq VX,RR
+            0x4000: ("skne V{x:X},{nn}", skip_next_ne_const),             # 0x4XRR skne VX,RR
+            0x5000: ("skeq V{x:X},V{y:X}", skip_next_eq_reg),             # 0x5XY0 skeq VX,VY
+            0x6000: ("mov V{x:X},{nn}", load_const),                      # 0x6XRR mov VX,RR
+            0x7000: ("add V{x:X},{nn}", add_const),                       # 0x7XRR add VX,RR
+            0x8000: ("mov V{x:X},V{y:X}", load_reg),                      # 0x8XY0 mov VX,VY
+            0x8001: ("or V{x:X},V{y:X}", or_reg),                         # 0x8XY1 or VX,VY
+            0x8002: ("and V{x:X},V{y:X}", and_reg),                       # 0x8XY2 and VX,VY
+            0x8003: ("xor V{x:X},V{y:X}", xor_reg),                       # 0x8XY3 xor VX,VY
+            0x8004: ("add V{x:X},V{y:X}", add_reg),                       # 0x8XY4 add VX,VY
+            0x8005: ("sub V{x:X},V{y:X}", sub_reg),                       # 0x8XY5 sub VX,VY
+            0x8006: ("shr V{x:X}", shift_right),                          # 0x8X06 shr VX
+            0x8007: ("rsb V{x:X},V{y:X}", sub_reg_reverse),               # 0x8XY7 rsb VX,VY
+            0x800e: ("shl V{x:X}", shift_left),                           # 0x8X0e shl VX
+            0x9000: ("skne V{x:X},V{y:X}", skip_next_ne_reg),             # 0x9XY0 skne VX,VY
+            0xa000: ("mvi 0x{nnn:03X}", load_const_i),                    # 0xaNNN mvi NNN
+            0xb000: ("jmi 0x{nnn:03X}", jump_i),                          # 0xbNNN jmi NNN
+            0xc000: ("rand V{x:X},0x{nn:02X}", load_random),              # 0xcXKK rand VX,KK
+            0xd000: ("sprite V{x:X},V{y:X},0x{n:X}", draw_sprite),        # 0xdXYN sprite VX,VY,N
+            0xe09e: ("skpr 0x{x:X}", skip_keydown),                       # 0xeK9e skpr K
+            0xe0a1: ("skup 0x{x:X}", skip_keyup),                         # 0xeKa1 skup K
+            0xf007: ("gdelay 0x{x:X}", get_delay),                        # 0xfR07 gdelay VR
+            0xf00a: ("key V{x:X}", wait_key),                             # 0xfR0a key VR
+            0xf015: ("sdelay V{x:X}", set_delay_timer),                   # 0xfR15 sdelay VR
+            0xf018: ("ssound V{x:X}", set_sound_timer),                   # 0xfR18 ssound VR
+            0xf01e: ("adi V{x:X}", add_to_i),                             # 0xfR1e adi VR
+            0xf029: ("font V{x:X}", set_char),                            # 0xfR29 font VR
+            0xf033: ("bcd V{x:X}", put_bcd),                              # 0xfR33 bcd VR
+            0xf055: ("str V{x:X}", store_reg_to_mem),                     # 0xfR55 str V0-VR
+            0xf065: ("ldr V{x:X}", load_reg_from_mem),                    # 0xfR65 ldr V0-VR
             }
 
+    # all 65536 opcodes, predecoded once
+    decode_table = build_decode_table(op_map)
+
+    # mnemonic templates by handler, only needed for disassembly
+    mnemonics = {op_func: op_str for op_str, op_func in op_map.values()}
+
+    def disassemble(self, pc, opcode):
+        # only called by UIs that actually display code, results are cached
+        try:
+            return self.disassembly[pc, opcode]
+        except KeyError:
+            pass
+        op_func, args = self.decode_table[opcode]
+        if op_func is None:
+            text = "TERMINATION"
+        else:
+            text = self.mnemonics[op_func].format(**operands(opcode))
+        self.disassembly[pc, opcode] = text
+        return text
+
     def cycle(self):
         # fetch an opcode
         current_pc = self.pc # save unmodified pc for printing correct mem location
@@ -272,72 +342,225 @@ class Chip8:
 
         self.opcode = self.memory[current_pc] << 8 | self.memory[current_pc + 1]
 
-        try: # decode an opcode
-            mask = 0xf000 # the first nibble is enough most of the time
-
-            # extend the mask if necessary
-            if self.opcode & 0xf000 == 0x8000:
-                mask = 0xf00f
-            elif self.opcode & 0xf000 in [0x0000, 0xe000, 0xf000]:
-                mask = 0xf0ff
-
-            # get a descriptive string (no params decoded) and the proper function
-            op_str, op_func = self.op_map[self.opcode & mask]
-        except KeyError:
+        # decoding is a single lookup, operands come pre-extracted
+        op_func, args = self.table[self.opcode]
+        if op_func is None:
             # indicates a buggy program or the pc running into uninitialized memory
-            self.ui.update_code_window(current_pc, "TERMINATION")
+            self.ui.update_code_window(current_pc, self.opcode)
+            self.ui.update_var_window(self)
+            self.ui.screen_redraw(self.screen)
             return False
 
-        if op_func: # indicated an implemented op code
-            decoded = op_func(self) # get a new descriptive string with decoded params
-            if decoded:
-                op_str = decoded
-            self.ui.update_code_window(current_pc, op_str) # print decoded instruction with params
-        else:
-            self.ui.update_code_window(current_pc, "*{}*".format(op_str)) # print unimplemented instruction
+        op_func(self, *args)
+
+        # list the instruction, the ui disassembles it only if it is shown
+        self.ui.update_code_window(current_pc, self.opcode)
 
         # insert space into code listing if a jump occured
         if current_pc != self.pc-2:
             self.ui.update_code_window()
 
-        # update currently set variables
-        self.ui.update_var_window(self)
+        self.cycles += 1
+        return True
 
-        # sleep to prevent too fast execution
-        if self.debug:
-            self.ui.wait_key()
-        else:
-            time.sleep(1/300)
+    def tick(self, render=True):
+        # 60Hz timers, called exactly once per frame
+        self.ui.poll() # input is taken in once per frame too
 
-        # handle timers with 60Hz
-        self.cycles += 1
-        if self.cycles >= 5:
-            self.ui.screen_redraw() # redraw screen too, while we're at it
+        if self.delay_timer > 0: # for use by programs, do nothing
+            self.delay_timer -= 1
+
+        if self.audio is not None: # the tone sounds for as long as the timer runs
+            self.audio.frame(self.sound_timer > 0)
+        if self.sound_timer > 0:
+            self.sound_timer -= 1
+
+        # redraw screen and variables too, unless the frame is dropped
+        if render:
+            self.ui.update_var_window(self)
+            self.ui.screen_redraw(self.screen)
 
-            if self.delay_timer > 0: # for use by programs, do nothing
-                self.delay_timer -= 1
+        for hook in self.frame_hooks:
+            hook()
 
-            if self.sound_timer > 0: # beep upon reaching zero
-                self.sound_timer -= 1
-                if self.sound_timer == 0:
-                    subprocess.Popen(["aplay", "beep.wav"], stderr=subprocess.DEVNULL)
+    def frame(self, render=True):
+        if self.blocks is None:
+            for _ in range(self.ipf):
+                if not self.cycle():
+                    return False
+        else:
+            # run whole translated blocks while they fit into the frame, the
+            # rest is interpreted so timers tick at the same instruction
+            budget = self.ipf
+            while budget:
+                block_pc = self.pc
+                block = self.blocks.get(block_pc)
+                if block is not None and block[1] <= budget:
+                    try:
+                        block[0](self)
+                    except Exception:
+                        # count what ran before the failing instruction, blocks are straight-line
+                        self.cycles += (self.pc - 2 - block_pc) // 2
+                        raise
+                    self.cycles += block[1]
+                    budget -= block[1]
+                else:
+                    if not self.cycle():
+                        return False
+                    budget -= 1
+        self.tick(render)
+        return True
 
+    def run(self, frames=None):
+        # run frames on a monotonic deadline, late frames are caught up by
+        # running them back to back without drawing, if too far behind the
+        # missed frames are dropped altogether
+        period = 1 / (FRAME_RATE * self.turbo)
+        deadline = time.monotonic()
+        render = True
+        count = 0
+        while count != frames:
+            if not self.frame(render):
+                return False
+            count += 1
+            if not self.paced:
+                continue
+            deadline += period
+            now = time.monotonic()
+            delay = deadline - now
+            render = delay > 0
+            if render:
+                time.sleep(delay)
+                self.idle += time.monotonic() - now
+            elif delay < -MAX_LAG * period:
+                deadline = time.monotonic()
         return True
 
+def print_state(chip8):
+    print("PC: 0x{:04X}  I: 0x{:04X}  SP: 0x{:04X}".format(chip8.pc, chip8.i, chip8.sp))
+    for reg in range(8):
+        print("V{:X}: 0x{:04X}  V{:X}: 0x{:04X}".format(reg, chip8.v[reg], reg+8, chip8.v[reg+8]))
+    print("delay: {}  sound: {}".format(chip8.delay_timer, chip8.sound_timer))
+    for y in range(32):
+        print("".join('█' if chip8.screen.get_pixel(x, y) else ' ' for x in range(64)).rstrip())
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
     parser.add_argument('filename')
-    parser.add_argument('-d', help='Debug by stepping through ROM.', action='store_true')
+    parser.add_argument('-d', help='Debug by stepping through ROM, or run to the first break if any are set. '
+                        'Keys while stopped: space step, n step over, o step out, g go, m run frames.',
+                        action='store_true')
+    parser.add_argument('--break', help='Stop at ADDR, optionally only if COND holds, e.g. "0x2a4 if V3 == 0x10". '
+                        'A bare COND stops when it becomes true. Implies -d.', action='append', default=[],
+                        dest='breaks', metavar='"ADDR [if COND]"')
+    parser.add_argument('--watch', help='Stop on changes to a register (V0-VF, I, DT, ST) or on writes to an '
+                        'address or range like 0x300-0x30f. Implies -d.', action='append', default=[],
+                        metavar='WHAT')
+    parser.add_argument('--step-frames', help='Frames run by the m key (default {}).'.format(STEP_FRAMES),
+                        type=int, default=STEP_FRAMES, metavar='N')
+    parser.add_argument('--headless', help='Run at full speed without a terminal UI.', action='store_true')
+    parser.add_argument('--cycles', help='Stop a headless run after N instructions, rounded up to whole frames.',
+                        type=int, metavar='N')
+    parser.add_argument('--ipf', help='Instructions per 60Hz frame (default {}).'.format(IPF),
+                        type=int, default=IPF, metavar='N')
+    parser.add_argument('--turbo', help='Run X times faster than real time.', type=float, default=1, metavar='X')
+    parser.add_argument('--no-pacing', help='Run as fast as possible.', action='store_true')
+    parser.add_argument('--translate', help='Compile ROM code into cached python blocks.', action='store_true')
+    parser.add_argument('--seed', help='Seed for the random number instruction.', type=int)
+    parser.add_argument('--profile', help='Profile handlers, addresses and ui calls, write a JSON report to FILE.',
+                        metavar='FILE')
+    parser.add_argument('--key-hold', help='Seconds a key stays pressed after its last press or repeat '
+                        '(default {}).'.format(KEY_HOLD), type=float, default=KEY_HOLD, metavar='S')
+    parser.add_argument('--render-thread', help='Draw and read keys on a separate thread, at a fixed rate.',
+                        action='store_true')
+    parser.add_argument('--refresh', help='Frames per second drawn by the render thread (default {}).'.format(
+                        REFRESH_RATE), type=float, default=REFRESH_RATE, metavar='HZ')
+    parser.add_argument('--audio', help='Where sound goes: "pipe" to a long lived aplay (default), "none", '
+                        'or a FILE.wav to record to. Headless runs are silent by default.', metavar='SINK')
+    parser.add_argument('--sample', help='Loop the samples of a 16 bit mono 44.1kHz WAV FILE, e.g. beep.wav, '
+                        'instead of a square wave.', metavar='FILE')
+    parser.add_argument('--record', help='Record inputs and random draws to a trace FILE, see recording.py.',
+                        metavar='FILE')
+    parser.add_argument('--record-instructions', help='Also record every executed instruction.',
+                        action='store_true')
     args = parser.parse_args()
-
-    ui = curses.wrapper(CursesUI)
-    myChip8 = Chip8(args.filename, ui, debug=args.d)
+    args.d = args.d or bool(args.breaks or args.watch)
+
+    if args.audio is None:
+        args.audio = 'none' if args.headless else 'pipe'
+    if args.audio == 'none':
+        sink = audio.NullSink()
+    elif args.audio == 'pipe':
+        try:
+            sink = audio.PipeSink()
+        except OSError as e:
+            print("no sound, can't start the player: {}".format(e), file=sys.stderr)
+            sink = audio.NullSink()
+    else:
+        sink = audio.WavSink(args.audio)
+    sound = audio.Audio(sink, FRAME_RATE, audio.load_wav(args.sample) if args.sample else None)
+
+    if args.headless:
+        myChip8 = Chip8(args.filename, NullUI(), paced=False, ipf=args.ipf, translate=args.translate,
+                        seed=args.seed, audio=sound)
+        profiler = Profiler(myChip8) if args.profile else None
+        if profiler:
+            profiler.attach()
+        recorder = Recorder(myChip8, args.record, args.record_instructions) if args.record else None
+        if recorder:
+            recorder.attach()
+
+        start = time.perf_counter()
+        while (args.cycles is None or myChip8.cycles < args.cycles) and myChip8.frame():
+            pass
+        elapsed = time.perf_counter() - start
+        if recorder:
+            recorder.detach()
+        sound.close()
+
+        print_state(myChip8)
+        print("{} instructions in {:.3f}s, {:.0f} instructions per second".format(
+            myChip8.cycles, elapsed, myChip8.cycles / elapsed if elapsed else 0))
+        if profiler:
+            profiler.detach()
+            profiler.dump(args.profile)
+            print(profiler.summary())
+        sys.exit(0)
+
+    ui = curses.wrapper(CursesUI, hold=args.key_hold)
+    if args.render_thread:
+        ui = ThreadedUI(ui, refresh=args.refresh)
+    myChip8 = Chip8(args.filename, ui, debug=args.d, paced=not args.no_pacing, ipf=args.ipf, turbo=args.turbo,
+                    translate=args.translate, seed=args.seed, audio=sound)
+    profiler = Profiler(myChip8) if args.profile else None
+    if profiler:
+        profiler.attach()
+    recorder = Recorder(myChip8, args.record, args.record_instructions) if args.record else None
+    if recorder:
+        recorder.attach()
+    if args.d:
+        debugger = Debugger(myChip8, frames=args.step_frames)
+        try:
+            for text in args.breaks:
+                debugger.parse(text)
+            for text in args.watch:
+                debugger.add_watch(parse_watch(text))
+        except ValueError as e:
+            ui.exit()
+            parser.error(e)
+        debugger.attach('run' if args.breaks or args.watch else 'step')
 
     try:
-        while myChip8.cycle():
-            pass
+        myChip8.run()
     except KeyboardInterrupt:
         time.sleep(1)
         ui.exit()
+    finally:
+        sound.close()
+        if recorder:
+            recorder.detach()
+        if profiler:
+            profiler.detach()
+            profiler.dump(args.profile)
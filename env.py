@@ -0,0 +1,69 @@
+try:
+    import numpy as np
+except ImportError: # observations are memoryviews then
+    np = None
+
+from emu import Chip8, IPF
+from ui import NullUI
+
+class Chip8Env:
+    # gym style wrapper around one headless machine, keys are a 16 bit mask
+    # like NullUI.keys, observations are read-only views of the 32 framebuffer
+    # rows, each a 64 bit int with pixel x at bit 63-x, they are not copies
+    # and change as the machine runs
+    def __init__(self, rom, frame_skip=1, ipf=IPF, translate=True, max_frames=None, seed=None):
+        self.chip8 = Chip8(rom, NullUI(), paced=False, ipf=ipf, translate=translate, seed=seed)
+        self.ui = self.chip8.ui
+        self.frame_skip = frame_skip # frames run per step
+        self.max_frames = max_frames # steps past this many frames are done
+        self.frames = 0
+        self.seed = seed # every reset starts over from it, unless given another
+        if np is not None:
+            self.observation = np.frombuffer(self.chip8.screen.buffer, dtype=np.uint64)
+            self.observation.flags.writeable = False
+        else:
+            self.observation = memoryview(self.chip8.screen.buffer).toreadonly().cast('Q')
+
+    def reset(self, seed=None):
+        chip8 = self.chip8
+        chip8.rng.seed(self.seed if seed is None else seed)
+        chip8.reset()
+        self.ui.keys = 0
+        self.frames = 0
+        return self.observation, self.info(False)
+
+    def step(self, keys, frames=None):
+        # hold keys for frames (default frame_skip) frames, returns the
+        # observation, whether the run is over and an info dict
+        if not isinstance(keys, int):
+            keys = sum(1 << k for k in set(keys))
+        self.ui.keys = keys
+        frame = self.chip8.frame
+        terminated = False
+        for _ in range(frames or self.frame_skip):
+            if not frame(False):
+                terminated = True
+                break
+            self.frames += 1
+        done = terminated or self.max_frames is not None and self.frames >= self.max_frames
+        return self.observation, done, self.info(terminated)
+
+    def info(self, terminated):
+        chip8 = self.chip8
+        return {'frames': self.frames,
+                'cycles': chip8.cycles,
+                'terminated': terminated,
+                'sound': chip8.sound_timer > 0}
+
+    def pixels(self):
+        # the screen unpacked to a (32, 64) bool array, this one is a copy
+        if np is None:
+            raise ImportError("pixels() needs numpy")
+        rows = self.observation.astype('>u8').view(np.uint8).reshape(32, 8)
+        return np.unpackbits(rows, axis=1).astype(bool)
+
+    def snapshot(self):
+        return self.chip8.snapshot()
+
+    def restore(self, blob):
+        self.chip8.restore(blob)
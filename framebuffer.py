@@ -0,0 +1,29 @@
+WIDTH = 64
+HEIGHT = 32
+
+class Framebuffer:
+    # the display as 32 rows of 64 pixels, each row is one 64 bit int in a
+    # shared bytearray, pixel x of a row is bit 63-x
+    def __init__(self):
+        self.buffer = bytearray(HEIGHT * 8)
+        self.rows = memoryview(self.buffer).cast('Q')
+
+    def clear(self):
+        self.buffer[:] = bytes(HEIGHT * 8)
+
+    def get_pixel(self, x, y):
+        return (self.rows[y] >> (63 - x)) & 1
+
+    def draw(self, x, y, sprite):
+        # xor sprite rows onto the display starting at (x, y), the origin wraps
+        # around, anything past the right or bottom edge is clipped
+        x %= WIDTH
+        y %= HEIGHT
+        rows = self.rows
+        collision = 0
+        for row, line in enumerate(sprite[:HEIGHT-y], y):
+            bits = (line << 56) >> x
+            old = rows[row]
+            collision |= old & bits
+            rows[row] = old ^ bits
+        return 1 if collision else 0
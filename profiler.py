@@ -0,0 +1,120 @@
+import json
+import time
+from collections import Counter
+
+SAMPLE = 16 # time one in this many calls of every handler
+
+UI_CALLS = ('update_code_window', 'update_var_window', 'screen_redraw', 'wait_key', 'poll')
+
+class Profiler:
+    # opt-in instrumentation, attach() swaps counting wrappers into a copy of
+    # the machine's dispatch table and into the ui, so an unprofiled machine
+    # runs the plain handlers without any checks
+    def __init__(self, chip8, sample=SAMPLE):
+        self.chip8 = chip8
+        self.sample = sample
+        self.handlers = {} # name -> [calls, sampled calls, sampled ns, histogram]
+        self.pcs = Counter()
+        self.ui_calls = {} # name -> [calls, seconds]
+        self.saved = None
+
+    def attach(self):
+        chip8 = self.chip8
+        self.saved = chip8.table, chip8.blocks, chip8.idle
+        chip8.blocks = None # translated blocks would bypass the table
+        self.start = time.perf_counter()
+
+        wrappers = {}
+        table = []
+        for op_func, args in chip8.table:
+            if op_func is not None and op_func not in wrappers:
+                wrappers[op_func] = self.wrap(op_func)
+            table.append((wrappers.get(op_func), args))
+        chip8.table = table
+
+        # instance attributes we replace, e.g. a recorder's wrappers, None for the class method
+        self.saved_ui = {name: vars(chip8.ui).get(name) for name in UI_CALLS}
+        for name in UI_CALLS:
+            setattr(chip8.ui, name, self.wrap_ui(name, getattr(chip8.ui, name)))
+
+    def detach(self):
+        chip8 = self.chip8
+        self.elapsed = time.perf_counter() - self.start
+        self.slept = chip8.idle - self.saved[2]
+        chip8.table, chip8.blocks, _ = self.saved
+        if chip8.blocks is not None:
+            chip8.blocks.clear() # it missed the writes made while we were attached
+        for name, method in self.saved_ui.items():
+            if method is None:
+                delattr(chip8.ui, name)
+            else:
+                setattr(chip8.ui, name, method)
+
+    def wrap(self, op_func):
+        stats = self.handlers[op_func.__name__] = [0, 0, 0, Counter()]
+        pcs = self.pcs
+        sample = self.sample
+        clock = time.perf_counter_ns
+
+        def profiled(chip8, *args):
+            pcs[chip8.pc - 2] += 1
+            stats[0] += 1
+            if stats[0] % sample:
+                return op_func(chip8, *args)
+            start = clock()
+            op_func(chip8, *args)
+            ns = clock() - start
+            stats[1] += 1
+            stats[2] += ns
+            stats[3][ns.bit_length()] += 1 # power of two buckets
+        return profiled
+
+    def wrap_ui(self, name, method):
+        stats = self.ui_calls[name] = [0, 0.0]
+        clock = time.perf_counter
+
+        def profiled(*args):
+            start = clock()
+            result = method(*args)
+            stats[0] += 1
+            stats[1] += clock() - start
+            return result
+        return profiled
+
+    def report(self):
+        total = sum(stats[0] for stats in self.handlers.values())
+        return {'instructions': total,
+                'seconds': self.elapsed,
+                'sleep_seconds': self.slept,
+                'handlers': {name: {'count': count,
+                                    'share': count / total if total else 0,
+                                    'sampled': sampled,
+                                    'mean_ns': sampled_ns / sampled if sampled else None,
+                                    # upper bound in ns -> sampled calls
+                                    'histogram': {2**bucket: n for bucket, n in sorted(histogram.items())}}
+                             for name, (count, sampled, sampled_ns, histogram) in self.handlers.items() if count},
+                'pcs': {"0x{:03X}".format(pc): count for pc, count in self.pcs.most_common()},
+                'ui': {name: {'count': count, 'seconds': seconds}
+                       for name, (count, seconds) in self.ui_calls.items()}}
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self, top=10):
+        report = self.report()
+        lines = ["{} instructions in {:.3f}s, {:.3f}s asleep".format(
+            report['instructions'], report['seconds'], report['sleep_seconds'])]
+        lines.append("{:<24}{:>10}{:>8}{:>10}".format("handler", "count", "share", "mean ns"))
+        for name, stats in sorted(report['handlers'].items(), key=lambda item: -item[1]['count']):
+            lines.append("{:<24}{:>10}{:>8.1%}{:>10}".format(
+                name, stats['count'], stats['share'],
+                "{:.0f}".format(stats['mean_ns']) if stats['mean_ns'] is not None else "-"))
+        lines.append("hottest addresses:")
+        for pc, count in list(report['pcs'].items())[:top]:
+            opcode = self.chip8.memory[int(pc, 16)] << 8 | self.chip8.memory[int(pc, 16)+1]
+            lines.append("  {}  {:>10}  {}".format(pc, count, self.chip8.disassemble(int(pc, 16), opcode)))
+        lines.append("ui calls:")
+        for name, stats in report['ui'].items():
+            lines.append("  {:<22}{:>10}{:>10.3f}s".format(name, stats['count'], stats['seconds']))
+        return "\n".join(lines)
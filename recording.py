@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import mmap
+import struct
+import time
+
+MAGIC = b'C8TR'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHBH20sI') # magic, version, flags, ipf, rom sha1, snapshot length
+WITH_INSTRUCTIONS = 1
+
+# one tag byte per event, followed by its payload
+FRAME = 1       # end of a frame
+KEY = 2         # B, result of a key query
+WAIT = 3        # B, key returned by a blocking key wait
+RAND = 4        # H, raw random draw
+INSTRUCTION = 5 # HH, pc and opcode before execution
+
+EVENTS = {KEY: struct.Struct('<BB'), WAIT: struct.Struct('<BB'),
+          RAND: struct.Struct('<BH'), INSTRUCTION: struct.Struct('<BHH')}
+
+FLUSH_SIZE = 1 << 16
+
+class ReplayError(Exception):
+    pass
+
+class EndOfTrace(Exception):
+    pass
+
+class RecordingRandom:
+    # stands in for chip8.rng and logs every draw
+    def __init__(self, rng, recorder):
+        self.rng = rng
+        self.recorder = recorder
+
+    def randint(self, a, b):
+        value = self.rng.randint(a, b)
+        self.recorder.event(RAND, value)
+        return value
+
+    def __getattr__(self, name): # getstate and friends, for snapshots
+        return getattr(self.rng, name)
+
+class Recorder:
+    # streams everything a run depends on besides the ROM into a compact
+    # binary trace: the results of all key queries and random draws, a marker
+    # per frame and optionally every executed instruction
+    def __init__(self, chip8, filename, instructions=False):
+        self.chip8 = chip8
+        self.file = open(filename, 'wb')
+        self.instructions = instructions
+        self.buffer = bytearray()
+
+    def attach(self):
+        chip8 = self.chip8
+        snapshot = chip8.snapshot()
+        self.file.write(HEADER.pack(MAGIC, VERSION, WITH_INSTRUCTIONS if self.instructions else 0,
+                                    chip8.ipf, hashlib.sha1(chip8.rom).digest(), len(snapshot)))
+        self.file.write(snapshot)
+
+        ui = chip8.ui
+        # instance attributes we replace, e.g. a profiler's wrappers, None for the class method
+        self.saved_ui = {name: vars(ui).get(name) for name in ('get_key', 'wait_key')}
+        get_key, wait_key = ui.get_key, ui.wait_key
+        def recorded_get_key(k):
+            state = get_key(k)
+            self.event(KEY, 1 if state else 0)
+            return state
+        def recorded_wait_key():
+            k = wait_key()
+            self.event(WAIT, k)
+            return k
+        ui.get_key = recorded_get_key
+        ui.wait_key = recorded_wait_key
+
+        self.saved = chip8.rng, chip8.table, chip8.blocks
+        chip8.rng = RecordingRandom(chip8.rng, self)
+        if self.instructions:
+            chip8.blocks = None # translated blocks would bypass the table
+            chip8.table = [(self.wrap(op_func), args) if op_func else (op_func, args)
+                           for op_func, args in chip8.table]
+        chip8.frame_hooks.append(self.frame)
+
+    def detach(self):
+        chip8 = self.chip8
+        chip8.rng, chip8.table, chip8.blocks = self.saved
+        if self.instructions and chip8.blocks is not None:
+            chip8.blocks.clear() # it missed the writes made while we were attached
+        for name, method in self.saved_ui.items():
+            if method is None:
+                delattr(chip8.ui, name)
+            else:
+                setattr(chip8.ui, name, method)
+        chip8.frame_hooks.remove(self.frame)
+        self.file.write(self.buffer)
+        self.file.close()
+
+    def wrap(self, op_func):
+        def recorded(chip8, *args):
+            pc = chip8.pc - 2
+            self.event(INSTRUCTION, pc, chip8.memory[pc] << 8 | chip8.memory[pc+1])
+            return op_func(chip8, *args)
+        return recorded
+
+    def event(self, tag, *payload):
+        self.buffer += EVENTS[tag].pack(tag, *payload)
+
+    def frame(self):
+        self.buffer.append(FRAME)
+        if len(self.buffer) >= FLUSH_SIZE:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+
+class Trace:
+    # sequential reader over a memory mapped trace
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, self.ipf, self.rom_hash, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("not a trace")
+        if version != VERSION:
+            raise ValueError("unsupported trace version {}".format(version))
+        self.snapshot = self.data[HEADER.size:HEADER.size+length]
+        self.pos = HEADER.size + length
+
+    def next(self, tag):
+        # payload of the next event, which has to be of the given kind
+        if self.pos >= len(self.data):
+            raise EndOfTrace()
+        found = self.data[self.pos]
+        if found != tag:
+            raise ReplayError("expected event {} but found {} at offset {}".format(tag, found, self.pos))
+        if tag == FRAME:
+            self.pos += 1
+            return ()
+        event = EVENTS[tag]
+        payload = event.unpack_from(self.data, self.pos)[1:]
+        self.pos += event.size
+        return payload
+
+class ReplayRandom:
+    def __init__(self, rng, trace):
+        self.rng = rng
+        self.trace = trace
+
+    def randint(self, a, b):
+        return self.trace.next(RAND)[0]
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+def replay(trace, chip8):
+    # drive a headless chip8 through a recorded run, returns the number of
+    # frames replayed, raises ReplayError if the run diverges from the trace
+    if hashlib.sha1(chip8.rom).digest() != trace.rom_hash:
+        raise ReplayError("trace was recorded with a different ROM")
+    chip8.restore(trace.snapshot)
+    chip8.ipf = trace.ipf
+    chip8.rng = ReplayRandom(chip8.rng, trace)
+    chip8.ui.get_key = lambda k: bool(trace.next(KEY)[0])
+    chip8.ui.wait_key = lambda: trace.next(WAIT)[0]
+    if trace.flags & WITH_INSTRUCTIONS:
+        chip8.blocks = None
+        chip8.table = [(checked(op_func, trace), args) if op_func else (op_func, args)
+                       for op_func, args in chip8.table]
+
+    frames = 0
+    try:
+        while trace.pos < len(trace.data) and chip8.frame():
+            trace.next(FRAME)
+            frames += 1
+    except EndOfTrace:
+        pass
+    return frames
+
+def checked(op_func, trace):
+    def replayed(chip8, *args):
+        pc = chip8.pc - 2
+        if trace.next(INSTRUCTION) != (pc, chip8.memory[pc] << 8 | chip8.memory[pc+1]):
+            raise ReplayError("diverged at pc 0x{:03X}".format(pc))
+        return op_func(chip8, *args)
+    return replayed
+
+if __name__ == "__main__":
+    from emu import Chip8, print_state
+    from ui import NullUI
+
+    parser = argparse.ArgumentParser(description='Replay a recorded run headless, at full speed.')
+    parser.add_argument('trace')
+    parser.add_argument('rom')
+    args = parser.parse_args()
+
+    trace = Trace(args.trace)
+    myChip8 = Chip8(args.rom, NullUI(), paced=False, translate=not trace.flags & WITH_INSTRUCTIONS)
+    start = time.perf_counter()
+    frames = replay(trace, myChip8)
+    elapsed = time.perf_counter() - start
+
+    print_state(myChip8)
+    print("{} frames, {} instructions in {:.3f}s".format(frames, myChip8.cycles, elapsed))
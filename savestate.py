@@ -0,0 +1,111 @@
+import struct
+import zlib
+from array import array
+from collections import deque
+
+MAGIC = b'C8SS'
+VERSION = 1
+
+HEADER = struct.Struct('<4sH')     # magic, version
+REGISTERS = struct.Struct('<HQbBBHQH') # pc, i, sp, delay, sound, opcode, cycles, keys
+RNG = struct.Struct('<625I?d')     # mersenne twister state, gauss_next
+
+STACK_SIZE = 32
+V_SIZE = 16
+SCREEN_SIZE = 256
+
+def pack(chip8):
+    # the whole machine as a fixed size, uncompressed byte string
+    _, mt, gauss_next = chip8.rng.getstate()
+    return b''.join((
+        REGISTERS.pack(chip8.pc, chip8.i, chip8.sp, chip8.delay_timer, chip8.sound_timer,
+                       chip8.opcode, chip8.cycles, getattr(chip8.ui, 'keys', 0)),
+        chip8.stack.tobytes(),
+        chip8.v,
+        chip8.memory,
+        chip8.screen.buffer,
+        RNG.pack(*mt, gauss_next is not None, gauss_next or 0.0)))
+
+def unpack(chip8, raw):
+    (chip8.pc, chip8.i, chip8.sp, chip8.delay_timer, chip8.sound_timer,
+     chip8.opcode, chip8.cycles, keys) = REGISTERS.unpack_from(raw)
+    if hasattr(chip8.ui, 'keys'):
+        chip8.ui.keys = keys
+    offset = REGISTERS.size
+    chip8.stack[:] = array('H', raw[offset:offset+STACK_SIZE])
+    offset += STACK_SIZE
+    chip8.v[:] = raw[offset:offset+V_SIZE]
+    offset += V_SIZE
+    chip8.memory[:] = raw[offset:offset+len(chip8.memory)]
+    offset += len(chip8.memory)
+    chip8.screen.buffer[:] = raw[offset:offset+SCREEN_SIZE]
+    offset += SCREEN_SIZE
+    *mt, has_gauss, gauss_next = RNG.unpack_from(raw, offset)
+    chip8.rng.setstate((3, tuple(mt), gauss_next if has_gauss else None))
+    if chip8.blocks is not None:
+        chip8.blocks.clear()
+
+def snapshot(chip8):
+    return HEADER.pack(MAGIC, VERSION) + zlib.compress(pack(chip8))
+
+def size(chip8):
+    # length of what pack() returns
+    return REGISTERS.size + STACK_SIZE + V_SIZE + len(chip8.memory) + SCREEN_SIZE + RNG.size
+
+def restore(chip8, blob):
+    try:
+        magic, version = HEADER.unpack_from(blob)
+    except struct.error:
+        raise ValueError("not a save state")
+    if magic != MAGIC:
+        raise ValueError("not a save state")
+    if version != VERSION:
+        raise ValueError("unsupported save state version {}".format(version))
+    try:
+        raw = zlib.decompress(blob[HEADER.size:])
+    except zlib.error:
+        raise ValueError("corrupt save state")
+    if len(raw) != size(chip8):
+        raise ValueError("save state is {} bytes, expected {}".format(len(raw), size(chip8)))
+    unpack(chip8, raw)
+
+def xor(a, b):
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+class Rewind:
+    # bounded history of one state per frame, only the newest state is kept
+    # whole, each older one is stored as the compressed xor against its
+    # successor, so mostly unchanged frames cost a few dozen bytes
+    def __init__(self, chip8, frames=60*60):
+        self.chip8 = chip8
+        self.current = None
+        self.deltas = deque(maxlen=frames)
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def size(self):
+        # approximate memory use in bytes
+        return len(self.current or b'') + sum(len(delta) for delta in self.deltas)
+
+    def record(self):
+        # call once per frame, e.g. from chip8.frame_hooks
+        raw = pack(self.chip8)
+        if self.current is not None:
+            self.deltas.append(zlib.compress(xor(self.current, raw), 1))
+        self.current = raw
+
+    def rewind(self, frames=1):
+        # step the machine back up to the given number of recorded frames,
+        # returns how many it actually went back
+        count = 0
+        while count < frames and self.deltas:
+            self.current = xor(self.current, zlib.decompress(self.deltas.pop()))
+            count += 1
+        if self.current is not None:
+            unpack(self.chip8, self.current)
+        return count
+
+    def clear(self):
+        self.current = None
+        self.deltas.clear()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# the modules live in the repository root, next to emu.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import rom # words to ROM bytes, shared with the synthetic benchmarks
+
+BREAKOUT = os.path.join(ROOT, 'roms', 'breakout.rom')
@@ -0,0 +1,44 @@
+import wave
+from array import array
+
+import audio
+from emu import Chip8, FRAME_RATE
+from ui import NullUI
+
+from conftest import rom
+
+# sets the sound timer to 5, then spins
+BEEP = rom(0x6005,  # 0x200 mov V0,5
+           0xf018,  # 0x202 ssound V0
+           0x1204)  # 0x204 jmp 0x204
+
+def test_timer_frames_are_tone_frames(tmp_path):
+    filename = str(tmp_path / 'beep.wav')
+    sound = audio.Audio(audio.WavSink(filename), FRAME_RATE)
+    chip8 = Chip8(BEEP, NullUI(), paced=False, audio=sound)
+    for _ in range(12):
+        assert chip8.frame()
+    sound.close()
+
+    per_frame = audio.RATE // FRAME_RATE
+    with wave.open(filename, 'rb') as f:
+        assert (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (1, 2, audio.RATE)
+        assert f.getnframes() == 12 * per_frame
+        samples = array('h', f.readframes(f.getnframes()))
+    frames = [samples[n*per_frame:(n+1)*per_frame] for n in range(12)]
+    assert [any(frame) for frame in frames] == [True] * 5 + [False] * 7
+    assert all(min(frame) < 0 < max(frame) for frame in frames[:5]) # a wave, not a level
+
+def test_phase_carries_over():
+    # the tone continues where the last frame left off, also across its end
+    written = []
+    class Sink:
+        def write(self, samples):
+            written.append(samples)
+    tone = bytes(range(100))
+    sound = audio.Audio(Sink(), 600, tone, rate=3000) # 5 samples, 10 bytes a frame
+    for on in (True, False, True, True, True, True, True, True, True, True, True, True):
+        sound.frame(on)
+    played = b''.join(frame for frame in written if any(frame))
+    assert written[1] == bytes(10)
+    assert played == tone + tone[:10]
@@ -0,0 +1,105 @@
+import pytest
+
+from debugger import Condition, Debugger, parse_watch
+from emu import Chip8
+from profiler import Profiler
+from recording import Recorder, Trace, replay
+from ui import NullUI
+
+from conftest import BREAKOUT
+
+FRAMES = 200
+
+def state(chip8):
+    return (chip8.pc, chip8.i, chip8.sp, chip8.cycles, bytes(chip8.v), bytes(chip8.memory),
+            bytes(chip8.screen.buffer))
+
+def machine():
+    return Chip8(BREAKOUT, NullUI(), paced=False, seed=1)
+
+def run(chip8, frames=FRAMES):
+    for _ in range(frames):
+        assert chip8.frame()
+
+def test_breaks_do_not_change_the_run():
+    plain = machine()
+    run(plain)
+
+    stops = []
+    chip8 = machine()
+    debugger = Debugger(chip8, on_stop=lambda debugger, reason: stops.append(reason) or 'continue')
+    debugger.attach('run')
+    debugger.parse('0x220')
+    debugger.add_watch(parse_watch('V3'))
+    debugger.add_watch(parse_watch('0x300-0x3ff'))
+    run(chip8)
+    assert state(chip8) == state(plain)
+    assert 'break 0x220' in stops
+    assert any(reason.startswith('V3 ') for reason in stops)
+    assert any(reason.startswith('write ') for reason in stops)
+
+def test_step_over():
+    stops = []
+    commands = iter(['over'])
+    def on_stop(debugger, reason):
+        stops.append((reason, debugger.next_pc, debugger.chip8.sp))
+        return next(commands, 'continue')
+    chip8 = machine()
+    debugger = Debugger(chip8, on_stop=on_stop)
+    debugger.attach('run')
+    debugger.parse('0x220') # jsr
+    run(chip8, 60)
+    assert stops[:2] == [('break 0x220', 0x220, 0), ('stepped over', 0x222, 0)]
+
+def test_with_profiler_and_recorder(tmp_path):
+    # each one instruments the table left by the one attached before it
+    trace = str(tmp_path / 'run.trc')
+    stops = []
+    chip8 = machine()
+    profiler = Profiler(chip8)
+    profiler.attach()
+    recorder = Recorder(chip8, trace, instructions=True)
+    recorder.attach()
+    debugger = Debugger(chip8, on_stop=lambda debugger, reason: stops.append(reason) or 'continue')
+    debugger.attach('run')
+    debugger.parse('0x220')
+    run(chip8)
+    debugger.detach()
+    recorder.detach()
+    profiler.detach()
+
+    assert 'break 0x220' in stops
+    assert profiler.report()['instructions'] == chip8.cycles
+    replayed = machine()
+    assert replay(Trace(trace), replayed) == FRAMES
+    assert state(replayed) == state(chip8)
+    assert chip8.table is chip8.decode_table
+
+def test_detach_in_any_order(tmp_path):
+    # a profiler attached after a recorder puts back the recorder's wrappers
+    chip8 = machine()
+    ui = chip8.ui
+    recorder = Recorder(chip8, str(tmp_path / 'run.trc'))
+    recorder.attach()
+    recorded = ui.get_key, ui.wait_key
+    profiler = Profiler(chip8)
+    profiler.attach()
+    run(chip8, 10)
+    profiler.detach()
+    assert (ui.get_key, ui.wait_key) == recorded
+    recorder.detach()
+    assert vars(ui).keys().isdisjoint(('get_key', 'wait_key', 'poll', 'screen_redraw'))
+
+@pytest.mark.parametrize('text', ['0x220 if X3 == 1', 'v3 == len(I)', 'PC > 0x200 and dt == 0', 'V3 ==', 'c.memory[0]'])
+def test_bad_conditions_are_rejected(text):
+    # before the run, where emu.py reports them, not from inside a handler
+    with pytest.raises(ValueError):
+        Debugger(machine()).parse(text)
+
+def test_registers_ignore_case():
+    chip8 = machine()
+    chip8.v[3] = 0x10
+    condition = Condition('v3 == 0x10 and VA == 0')
+    assert condition.names == {'V3', 'VA'}
+    assert condition(chip8)
+    assert parse_watch('vf') == 'VF'
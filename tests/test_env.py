@@ -0,0 +1,55 @@
+import pytest
+
+import env
+from env import Chip8Env
+
+from conftest import BREAKOUT
+
+KEYS = [0, [4], [6], [4, 6], 1 << 4]
+
+def play(environment, seed=None, steps=300):
+    environment.reset(seed)
+    for n in range(steps):
+        observation, done, info = environment.step(KEYS[n % len(KEYS)])
+    return bytes(observation), environment.chip8.snapshot(), info
+
+def test_reset_is_reproducible():
+    environment = Chip8Env(BREAKOUT, frame_skip=4, seed=3)
+    first = play(environment)
+    assert play(environment) == first
+    assert play(Chip8Env(BREAKOUT, frame_skip=4, seed=3)) == first
+    assert play(environment, seed=3) == first
+
+def test_observation_is_a_view():
+    environment = Chip8Env(BREAKOUT, frame_skip=2, seed=0)
+    observation, _ = environment.reset()
+    environment.step(0, frames=50)
+    assert bytes(observation) == bytes(environment.chip8.screen.buffer)
+    assert any(observation)
+    with pytest.raises((ValueError, TypeError)):
+        observation[0] = 0
+
+def test_done_after_max_frames():
+    environment = Chip8Env(BREAKOUT, frame_skip=4, max_frames=40, seed=0)
+    environment.reset()
+    results = [environment.step(0)[1] for _ in range(10)]
+    assert results == [False] * 9 + [True]
+    assert environment.step(0)[2]['frames'] == 44
+
+def test_pixels():
+    pytest.importorskip('numpy')
+    environment = Chip8Env(BREAKOUT, seed=0)
+    environment.reset()
+    environment.step(0, frames=50)
+    pixels = environment.pixels()
+    screen = environment.chip8.screen
+    assert pixels.shape == (32, 64)
+    assert all(pixels[y, x] == screen.get_pixel(x, y) for y in range(32) for x in range(64))
+
+def test_without_numpy(monkeypatch):
+    monkeypatch.setattr(env, 'np', None)
+    environment = Chip8Env(BREAKOUT, seed=0)
+    observation, _ = environment.reset()
+    assert isinstance(observation, memoryview) and observation.readonly
+    with pytest.raises(ImportError):
+        environment.pixels()
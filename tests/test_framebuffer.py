@@ -0,0 +1,70 @@
+import pytest
+
+from emu import Chip8
+from framebuffer import Framebuffer, WIDTH, HEIGHT
+from ui import NullUI
+
+from conftest import rom
+
+def lit(screen):
+    return {(x, y) for y in range(HEIGHT) for x in range(WIDTH) if screen.get_pixel(x, y)}
+
+def test_draw():
+    screen = Framebuffer()
+    assert screen.draw(8, 4, [0xa0, 0x40]) == 0
+    assert lit(screen) == {(8, 4), (10, 4), (9, 5)}
+
+def test_origin_wraps():
+    screen = Framebuffer()
+    screen.draw(WIDTH + 3, 2 * HEIGHT + 2, [0x80])
+    assert lit(screen) == {(3, 2)}
+
+def test_right_edge_clips():
+    screen = Framebuffer()
+    screen.draw(60, 0, [0xff])
+    assert lit(screen) == {(60, 0), (61, 0), (62, 0), (63, 0)}
+
+def test_bottom_edge_clips():
+    screen = Framebuffer()
+    screen.draw(0, 30, [0x80, 0x80, 0x80, 0x80])
+    assert lit(screen) == {(0, 30), (0, 31)}
+
+def test_collision():
+    screen = Framebuffer()
+    assert screen.draw(0, 0, [0xf0]) == 0
+    assert screen.draw(4, 0, [0xf0]) == 0 # touching isn't colliding
+    assert screen.draw(2, 0, [0xc0]) == 1 # erases (2, 0) and (3, 0)
+    assert lit(screen) == {(0, 0), (1, 0), (4, 0), (5, 0), (6, 0), (7, 0)}
+    assert screen.draw(0, 0, [0xff]) == 1
+    assert lit(screen) == {(2, 0), (3, 0)}
+
+def test_clipped_pixels_do_not_collide():
+    screen = Framebuffer()
+    screen.draw(0, 0, [0xff])
+    screen.draw(0, 31, [0xff])
+    assert screen.draw(60, 0, [0x0f]) == 0 # would wrap onto (0, 0)-(3, 0)
+    assert screen.draw(0, 31, [0x00, 0xff]) == 0 # would wrap onto row 0
+    assert screen.draw(63, 31, [0x80]) == 0
+
+# draws a 16 row sprite with n = 0, then spins
+TALL_SPRITE = rom(0xa208,  # 0x200 mvi 0x208
+                  0xd010,  # 0x202 sprite V0,V1,0
+                  0x1204,  # 0x204 jmp 0x204
+                  0x0000,  # 0x206
+                  *[0x8040] * 7, 0xc0c0)   # 0x208 16 rows, a zigzag closed by two wide ones
+TALL_PIXELS = {(y % 2, y) for y in range(14)} | {(0, 14), (1, 14), (0, 15), (1, 15)}
+
+def test_sixteen_rows():
+    chip8 = Chip8(TALL_SPRITE, NullUI(), paced=False)
+    assert chip8.frame()
+    assert lit(chip8.screen) == TALL_PIXELS
+    assert chip8.v[0xf] == 0
+
+def test_sixteen_rows_vector():
+    # vector.py draws with its own copy of these rules
+    np = pytest.importorskip('numpy')
+    from vector import VectorChip8
+    vector = VectorChip8(TALL_SPRITE, 2)
+    vector.frame()
+    for pixels in vector.pixels():
+        assert {(x, y) for y, x in np.argwhere(pixels)} == TALL_PIXELS
@@ -0,0 +1,94 @@
+import struct
+import zlib
+
+import pytest
+
+import savestate
+from emu import Chip8
+from savestate import Rewind
+from ui import NullUI
+
+from conftest import BREAKOUT
+
+def state(chip8):
+    return (chip8.pc, chip8.opcode, chip8.sp, chip8.i, chip8.delay_timer, chip8.sound_timer, chip8.cycles,
+            bytes(chip8.v), chip8.stack.tobytes(), bytes(chip8.memory), bytes(chip8.screen.buffer),
+            chip8.rng.getstate())
+
+def machine(translate=False):
+    return Chip8(BREAKOUT, NullUI(), paced=False, seed=1, translate=translate)
+
+def run(chip8, frames):
+    for _ in range(frames):
+        assert chip8.frame()
+
+@pytest.mark.parametrize('translate', [False, True])
+def test_round_trip(translate):
+    chip8 = machine(translate)
+    chip8.ui.keys = 1 << 4
+    run(chip8, 100)
+    blob = chip8.snapshot()
+    before = state(chip8)
+    run(chip8, 50)
+    after = state(chip8)
+
+    chip8.ui.keys = 0
+    chip8.restore(blob)
+    assert state(chip8) == before
+    assert chip8.ui.keys == 1 << 4
+    run(chip8, 50)
+    assert state(chip8) == after
+
+    other = machine(translate) # a fresh machine picks up the run too
+    other.restore(blob)
+    run(other, 50)
+    assert state(other) == after
+
+def test_rewind():
+    chip8 = machine()
+    rewind = Rewind(chip8, frames=30)
+    chip8.frame_hooks.append(rewind.record)
+    states = []
+    for _ in range(50):
+        assert chip8.frame()
+        states.append(state(chip8))
+    assert len(rewind) == 30 # the oldest states were dropped
+
+    assert rewind.rewind(10) == 10
+    assert state(chip8) == states[-11]
+    assert rewind.rewind() == 1
+    assert state(chip8) == states[-12]
+    assert rewind.rewind(100) == 19
+    assert state(chip8) == states[-31]
+    assert rewind.rewind() == 0
+    assert state(chip8) == states[-31]
+
+    chip8.frame_hooks.clear() # runs on from a rewound state like from any other
+    run(chip8, 20)
+    assert state(chip8) == states[-11]
+
+HEADER = struct.pack('<4sH', b'C8SS', 1)
+
+@pytest.mark.parametrize('blob', [
+        b'',
+        b'C8S',
+        b'C8TR\x01\x00' + zlib.compress(b''),
+        struct.pack('<4sH', b'C8SS', 2),
+        HEADER + b'garbage',
+        HEADER + zlib.compress(bytes(100)),
+        HEADER + zlib.compress(bytes(10000)),
+        ], ids=['empty', 'short', 'magic', 'version', 'garbage', 'short state', 'long state'])
+def test_bad_blobs(blob):
+    chip8 = machine()
+    run(chip8, 10)
+    before = state(chip8)
+    with pytest.raises(ValueError):
+        chip8.restore(blob)
+    assert state(chip8) == before
+
+def test_truncated_blob():
+    chip8 = machine()
+    blob = chip8.snapshot()
+    with pytest.raises(ValueError):
+        chip8.restore(blob[:len(blob) // 2])
+    assert len(savestate.pack(chip8)) == savestate.size(chip8)
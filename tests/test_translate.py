@@ -0,0 +1,98 @@
+import pytest
+
+from debugger import Debugger
+from emu import Chip8
+from profiler import Profiler
+from recording import Recorder
+from translate import BlockCache
+from ui import NullUI
+
+from conftest import BREAKOUT, rom
+
+# rewrites the add at 0x20c with a new operand every loop, the block that
+# holds it is translated once and has to be invalidated by the str
+SELF_MODIFYING = rom(0xa20c,  # 0x200 mvi 0x20c
+                     0x607a,  # 0x202 mov V0,0x7A
+                     0x7101,  # 0x204 add V1,1
+                     0xf155,  # 0x206 str V0-V1
+                     0x7201,  # 0x208 add V2,1
+                     0x7201,  # 0x20a add V2,1
+                     0x7a00,  # 0x20c add VA,0, rewritten
+                     0x1200)  # 0x20e jmp 0x200
+
+# rewrites the mov at 0x200 once, after 64 loops
+REWRITTEN_ONCE = rom(0x6005,  # 0x200 mov V0,5, becomes mov V0,9
+                     0x7b01,  # 0x202 add VB,1
+                     0x3b40,  # 0x204 skeq VB,0x40
+                     0x1200,  # 0x206 jmp 0x200
+                     0xa200,  # 0x208 mvi 0x200
+                     0x6060,  # 0x20a mov V0,0x60
+                     0x6109,  # 0x20c mov V1,9
+                     0xf155,  # 0x20e str V0-V1
+                     0x1200)  # 0x210 jmp 0x200
+
+def state(chip8):
+    return (chip8.pc, chip8.opcode, chip8.sp, chip8.i, chip8.delay_timer, chip8.sound_timer, chip8.cycles,
+            bytes(chip8.v), chip8.stack.tobytes(), bytes(chip8.memory), bytes(chip8.screen.buffer))
+
+def lockstep(code, ipf, frames):
+    # runs the interpreter and the translator side by side, returns the first
+    # frame after which they differ or None
+    interpreted = Chip8(code, NullUI(), paced=False, ipf=ipf, seed=1)
+    translated = Chip8(code, NullUI(), paced=False, ipf=ipf, seed=1, translate=True)
+    for frame in range(frames):
+        assert interpreted.frame() == translated.frame()
+        if state(interpreted) != state(translated):
+            return frame
+    return None
+
+@pytest.mark.parametrize('ipf', [1, 3, 10, 64])
+def test_breakout(ipf):
+    with open(BREAKOUT, 'rb') as f:
+        code = f.read()
+    assert lockstep(code, ipf, 600) is None
+
+@pytest.mark.parametrize('ipf', [1, 3, 10, 64])
+def test_self_modifying(ipf):
+    assert lockstep(SELF_MODIFYING, ipf, 200) is None
+
+def test_self_modifying_needs_invalidation(monkeypatch):
+    monkeypatch.setattr(BlockCache, 'invalidate', lambda self, start, end: None)
+    assert lockstep(SELF_MODIFYING, 10, 200) is not None
+
+# instruments that run without blocks while attached, each one attaches to
+# a machine and returns its detach
+INSTRUMENTS = {'profiler': lambda chip8, tmp_path: attached(Profiler(chip8)),
+               'recorder': lambda chip8, tmp_path: attached(Recorder(chip8, str(tmp_path / 'run.trc'), True)),
+               'debugger': lambda chip8, tmp_path: attached(Debugger(chip8, lambda debugger, reason: 'continue'), 'run')}
+
+def attached(instrument, *args):
+    instrument.attach(*args)
+    return instrument.detach
+
+@pytest.mark.parametrize('instrument', sorted(INSTRUMENTS))
+def test_detach_drops_stale_blocks(instrument, tmp_path):
+    # the code changes while blocks are off, so the ones translated before
+    # can't run again after detach
+    interpreted = Chip8(REWRITTEN_ONCE, NullUI(), paced=False, ipf=10, seed=1)
+    translated = Chip8(REWRITTEN_ONCE, NullUI(), paced=False, ipf=10, seed=1, translate=True)
+    for frame in range(60):
+        if frame == 5:
+            detach = INSTRUMENTS[instrument](translated, tmp_path)
+        elif frame == 40:
+            assert translated.memory[0x201] == 9
+            detach()
+        assert interpreted.frame() == translated.frame()
+        assert state(interpreted) == state(translated), frame
+
+def test_error_in_block():
+    # ldr past the end of memory raises after three instructions ran
+    code = rom(0xafff, 0x6001, 0x7001, 0xf365)
+    results = []
+    for translate in (False, True):
+        chip8 = Chip8(code, NullUI(), paced=False, translate=translate)
+        with pytest.raises(IndexError):
+            chip8.frame()
+        results.append(state(chip8))
+    assert results[0] == results[1]
+    assert results[0][0] == 0x208 and results[0][6] == 3
@@ -0,0 +1,80 @@
+import curses
+
+import pytest
+
+import ui
+from framebuffer import Framebuffer
+from ui import CursesUI
+
+class Window:
+    # just enough of a curses window to record what gets drawn
+    def __init__(self, size=(40, 120)):
+        self.size = size
+        self.cells = {}
+
+    def getmaxyx(self):
+        return self.size
+
+    def clear(self):
+        self.cells.clear()
+
+    def addstr(self, y, x, text, attr=0):
+        for n, char in enumerate(text):
+            self.cells[y, x+n] = char
+
+    def derwin(self, *args):
+        return Window()
+
+    def getch(self):
+        return curses.ERR
+
+    def border(self): pass
+    def chgat(self, *args): pass
+    def noutrefresh(self): pass
+    def keypad(self, flag): pass
+    def timeout(self, delay): pass
+
+@pytest.fixture
+def stdscr(monkeypatch):
+    for name in ('curs_set', 'init_pair', 'doupdate'):
+        monkeypatch.setattr(curses, name, lambda *args: None)
+    monkeypatch.setattr(curses, 'color_pair', lambda n: 0)
+    return Window()
+
+def lit(window, terminal):
+    # the framebuffer as the terminal shows it
+    return [[window.cells.get((terminal.screen_y+y, terminal.screen_x+x)) == '█' for x in range(ui.SCREEN_W)]
+            for y in range(ui.SCREEN_H)]
+
+def expected(screen):
+    return [[bool(screen.get_pixel(x, y)) for x in range(ui.SCREEN_W)] for y in range(ui.SCREEN_H)]
+
+def test_first_redraw_paints_lit_pixels(stdscr):
+    terminal = CursesUI(stdscr)
+    terminal.disassemble = lambda pc, opcode: ""
+    screen = Framebuffer()
+    screen.draw(0, 0, b'\xf0\x90\x90\x90\xf0')
+    screen.draw(60, 30, b'\xff\xff\xff')
+    terminal.screen_redraw(screen)
+    assert lit(stdscr, terminal) == expected(screen)
+
+def test_resize_repaints_lit_pixels(stdscr):
+    terminal = CursesUI(stdscr)
+    terminal.disassemble = lambda pc, opcode: ""
+    screen = Framebuffer()
+    screen.draw(0, 0, b'\xf0\x90\x90\x90\xf0')
+    terminal.screen_redraw(screen)
+    stdscr.size = (50, 140)
+    terminal.screen_redraw(screen) # clears the terminal and lays it out anew
+    assert (terminal.screen_y, terminal.screen_x) == (9, 22)
+    assert lit(stdscr, terminal) == expected(screen)
+
+def test_redraw_clears_unlit_pixels(stdscr):
+    terminal = CursesUI(stdscr)
+    terminal.disassemble = lambda pc, opcode: ""
+    screen = Framebuffer()
+    screen.draw(8, 4, b'\xff')
+    terminal.screen_redraw(screen)
+    screen.draw(8, 4, b'\x0f')
+    terminal.screen_redraw(screen)
+    assert lit(stdscr, terminal) == expected(screen)
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from emu import Chip8, PROGRAM_START
+from ui import NullUI
+from vector import VectorChip8, RUNNING, TERMINATED, ERROR
+
+from conftest import BREAKOUT
+
+MACHINES = 6
+FRAMES = 30
+
+def random_rom(rng, length=48):
+    # a program drawing from every opcode family, jumps mostly stay inside it
+    # and I mostly points at it, so programs run for a while before failing
+    families = sorted(Chip8.op_map)
+    words = []
+    for _ in range(length):
+        base = rng.choice(families)
+        if base & 0xf000 in (0x1000, 0x2000, 0xa000, 0xb000) and rng.random() < 0.9:
+            operand = PROGRAM_START + 2 * rng.randrange(length)
+        elif base & 0xf000 in (0x0000, 0xe000, 0xf000):
+            operand = rng.randrange(16) << 8 # only x is free
+        elif base & 0xf000 in (0x5000, 0x8000, 0x9000):
+            operand = rng.randrange(16) << 8 | rng.randrange(16) << 4
+        else:
+            operand = rng.randrange(0x1000)
+        words.append(base | operand)
+    if rng.random() < 0.2:
+        words[rng.randrange(length)] = 0x0000 # no handler, terminates
+    words.append(0x1000 | PROGRAM_START) # loop instead of running off the end
+    return b''.join(word.to_bytes(2, 'big') for word in words)
+
+def scalar_frame(chip8):
+    try:
+        return RUNNING if chip8.frame() else TERMINATED
+    except Exception: # the vector machine halts with ERROR instead
+        return ERROR
+
+def compare(scalar, vector, m):
+    assert scalar.pc == vector.pc[m]
+    assert scalar.i == vector.i[m]
+    assert scalar.sp == vector.sp[m]
+    assert scalar.opcode == vector.opcode[m]
+    assert scalar.cycles == vector.cycles[m]
+    assert scalar.delay_timer == vector.delay_timer[m]
+    assert scalar.sound_timer == vector.sound_timer[m]
+    assert bytes(scalar.v) == vector.v[m].tobytes()
+    assert list(scalar.stack) == vector.stack[m].tolist()
+    assert bytes(scalar.memory) == vector.memory[m].tobytes()
+    assert list(scalar.screen.rows) == vector.screen[m].tolist()
+
+@pytest.mark.parametrize('case', range(60))
+def test_random_rom(case):
+    rng = random.Random(case)
+    code = random_rom(rng)
+    seeds = list(range(MACHINES))
+    keys = [rng.getrandbits(16) if rng.random() < 0.5 else 0 for _ in seeds]
+
+    vector = VectorChip8(code, MACHINES, seeds=seeds)
+    vector.keys[:] = keys
+    scalars = []
+    for seed, pressed in zip(seeds, keys):
+        chip8 = Chip8(code, NullUI(), paced=False, seed=seed)
+        chip8.ui.keys = pressed
+        scalars.append(chip8)
+    status = [RUNNING] * MACHINES
+
+    for _ in range(FRAMES):
+        vector.frame()
+        for m, chip8 in enumerate(scalars):
+            if status[m] == RUNNING:
+                status[m] = scalar_frame(chip8)
+        for m, chip8 in enumerate(scalars):
+            assert status[m] == vector.status[m]
+            if status[m] != ERROR: # a failing handler may leave partial writes behind
+                compare(chip8, vector, m)
+
+def test_breakout():
+    with open(BREAKOUT, 'rb') as f:
+        code = f.read()
+    vector = VectorChip8(code, MACHINES, seeds=list(range(MACHINES)))
+    scalars = [Chip8(code, NullUI(), paced=False, seed=seed) for seed in range(MACHINES)]
+    for _ in range(120):
+        vector.frame()
+        for m, chip8 in enumerate(scalars):
+            assert scalar_frame(chip8) == vector.status[m] == RUNNING
+            compare(chip8, vector, m)
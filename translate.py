@@ -0,0 +1,121 @@
+MAX_BLOCK = 64 # instructions per translated block
+
+# straight-line handlers compiled to inline source, these have to match the
+# handlers in emu.py, v is bound to self.v in every block
+INLINE = {
+        'load_const': ["v[{x}] = {nn}"],
+        'add_const': ["v[{x}] = (v[{x}] + {nn}) & 0xff"],
+        'load_reg': ["v[{x}] = v[{y}]"],
+        'or_reg': ["v[{x}] = v[{x}] | v[{y}]"],
+        'and_reg': ["v[{x}] = v[{x}] & v[{y}]"],
+        'xor_reg': ["v[{x}] = v[{x}] ^ v[{y}]"],
+        'add_reg': ["r = v[{x}] + v[{y}]",
+                    "v[0xf] = r >> 8",
+                    "v[{x}] = r & 0xff"],
+        'sub_reg': ["vx = v[{x}]",
+                    "vy = v[{y}]",
+                    "v[0xf] = 1 if vx > vy else 0",
+                    "v[{x}] = (vx - vy) & 0xff"],
+        'shift_right': ["v[0xf] = v[{x}] & 2**0",
+                        "v[{x}] = v[{x}] >> 1"],
+        'shift_left': ["v[0xf] = v[{x}] >> 7",
+                       "v[{x}] = (v[{x}] << 1) & 0xff"],
+        'sub_reg_reverse': ["vx = v[{x}]",
+                            "vy = v[{y}]",
+                            "v[0xf] = 1 if vy > vx else 0",
+                            "v[{x}] = (vy - vx) & 0xff"],
+        'load_const_i': ["self.i = {nnn}"],
+        'get_delay': ["v[{x}] = self.delay_timer"],
+        'set_delay_timer': ["self.delay_timer = v[{x}]"],
+        'set_sound_timer': ["self.sound_timer = v[{x}]"],
+        'add_to_i': ["self.i = self.i + v[{x}]"],
+        'set_char': ["self.i = v[{x}]*5"],
+        }
+
+# handlers that end a block, because they change the pc, draw, wait for input
+# or write to memory that might hold translated code
+TERMINATORS = {
+        'return_from_subroutine', 'jump', 'jump_to_subroutine', 'jump_i',
+        'skip_next_eq_const', 'skip_next_ne_const', 'skip_next_eq_reg',
+        'skip_next_ne_reg', 'skip_keydown', 'skip_keyup', 'draw_sprite',
+        'wait_key', 'put_bcd', 'store_reg_to_mem',
+        }
+
+class BlockCache:
+    # translates straight-line runs of ROM code into single python functions,
+    # cached by entry address, each block returns after running all of its
+    # instructions with the pc set as the interpreter would have left it
+    def __init__(self, chip8):
+        self.chip8 = chip8
+        self.blocks = {} # entry address -> (function, instruction count)
+        self.covers = {} # memory address -> entry addresses of blocks using it
+
+    def get(self, pc):
+        try:
+            return self.blocks[pc]
+        except KeyError:
+            block = self.translate(pc)
+            if block is not None:
+                self.blocks[pc] = block
+            return block
+
+    def invalidate(self, start, end):
+        # drop all blocks translated from memory[start:end]
+        for addr in range(start, end):
+            for entry in self.covers.pop(addr, ()):
+                self.blocks.pop(entry, None)
+
+    def clear(self):
+        self.blocks.clear()
+        self.covers.clear()
+
+    def translate(self, entry):
+        memory = self.chip8.memory
+        decode_table = self.chip8.decode_table
+
+        lines = []
+        handlers = {}
+        addr = entry
+        count = 0
+        terminated = False
+        while count < MAX_BLOCK and addr + 1 < len(memory):
+            opcode = memory[addr] << 8 | memory[addr+1]
+            op_func, args = decode_table[opcode]
+            if op_func is None: # leave termination to the interpreter
+                break
+            count += 1
+            addr += 2
+
+            name = op_func.__name__
+            if name in INLINE:
+                fields = {'x': (opcode & 0x0f00) >> 8,
+                          'y': (opcode & 0x00f0) >> 4,
+                          'n': opcode & 0x000f,
+                          'nn': opcode & 0x00ff,
+                          'nnn': opcode & 0x0fff}
+                lines.extend(line.format(**fields) for line in INLINE[name])
+                continue
+
+            # handlers see the pc and opcode as the interpreter would set them,
+            # which also leaves both right if the handler raises
+            handlers[name] = op_func
+            lines.append("self.opcode = {}".format(opcode))
+            lines.append("self.pc = {}".format(addr))
+            lines.append("{}(self{})".format(name, "".join(", {}".format(arg) for arg in args)))
+            if name in TERMINATORS:
+                terminated = True
+                break
+
+        if not count:
+            return None
+        if not terminated: # fall through into the next block
+            lines.append("self.opcode = {}".format(memory[addr-2] << 8 | memory[addr-1]))
+            lines.append("self.pc = {}".format(addr))
+
+        source = "def block(self):\n    v = self.v\n" + "".join("    {}\n".format(line) for line in lines)
+        code = compile(source, "<block 0x{:03X}>".format(entry), "exec")
+        exec(code, handlers)
+
+        for covered in range(entry, addr):
+            self.covers.setdefault(covered, set()).add(entry)
+        return handlers['block'], count
@@ -1,6 +1,9 @@
+import select
 import sys
+import threading
+import time
 import curses
-from collections import defaultdict, deque
+from collections import defaultdict, deque, namedtuple
 
 SCREEN_W = 64
 SCREEN_H = 32
@@ -24,11 +27,43 @@ KEYMAP = { 0x0: ord('x'), 0x1: ord('1'), 0x2: ord('2'), 0x3: ord('3'),
            0xc: ord('4'), 0xd: ord('r'), 0xe: ord('f'), 0xf: ord('v')}
 INV_KEYMAP = {v: k for k, v in KEYMAP.items()}
 
+# debugger commands while stopped, any chip8 key steps as well
+DEBUG_KEYS = {ord(' '): 'step', ord('\n'): 'step', ord('n'): 'over', ord('o'): 'out',
+              ord('g'): 'continue', ord('m'): 'frames'}
+
+# terminals only report presses and autorepeats, a key counts as held for
+# this many seconds after the last one
+KEY_HOLD = 0.2
+
+REFRESH_RATE = 60 # presented frames per second when rendering on a thread
+
+PIXELS = str.maketrans('01', ' █')
+ROW_MASK = (1 << SCREEN_W) - 1
+RUN_GAP = 4 # changed runs closer than this are merged into one addstr
+
+def changed_runs(diff):
+    # columns [start, end) of the runs of set bits in a row diff, bit 63 is
+    # column 0, nearby runs are merged to save on cursor movement
+    runs = []
+    while diff:
+        start = SCREEN_W - diff.bit_length()
+        ones = (diff << start) & ROW_MASK
+        end = start + SCREEN_W - (ones ^ ROW_MASK).bit_length()
+        diff &= (1 << (SCREEN_W - end)) - 1
+        if runs and start - runs[-1][1] < RUN_GAP:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+    return runs
+
 class CursesUI:
-    def __init__(self, stdscr):
-        self.screen_contents = set()
+    def __init__(self, stdscr, hold=KEY_HOLD):
         self.code_contents = deque([], CODE_H)
-        self.lastpressed = 0
+        self.disassemble = None # set by the emulator, maps (pc, opcode) to text
+        self.keys = 0 # bitmask of currently held keys, bit k is key k
+        self.hold = hold
+        self.release_at = [0.0] * 16
+        self.commands = deque([], 16) # debugger keys pressed
 
         self.stdscr = stdscr
 
@@ -45,51 +80,94 @@ class CursesUI:
         self.stdscr.refresh()
         curses.endwin()
 
-    def wait_key(self):
-        self.stdscr.timeout(1)
+    def read_keys(self):
+        # drain all pending input into the key state, returns the first key
+        # pressed or None
+        first = None
+        now = time.monotonic()
         while True:
-            key = self.stdscr.getch(self.var_y, self.var_x+VAR_W-1)
-            self.stdscr.addstr(self.var_y, self.var_x+VAR_W-1, " ")
-            if key == curses.ERR or key not in INV_KEYMAP.keys():
+            key = self.stdscr.getch()
+            if key == curses.ERR:
+                return first
+            k = INV_KEYMAP.get(key)
+            if k is None:
+                if key in DEBUG_KEYS:
+                    self.commands.append(DEBUG_KEYS[key])
                 continue
-            self.stdscr.timeout(0)
-            return INV_KEYMAP[key]
+            self.keys |= 1 << k
+            self.release_at[k] = now + self.hold
+            if first is None:
+                first = k
 
-    def get_key(self, k):
-        state = self.lastpressed == KEYMAP[k]
-        if state:
-            self.lastpressed = 0
-        return state
+    def poll(self):
+        # once per frame, take in new presses and release expired keys,
+        # returns the first key pressed or None
+        first = self.read_keys()
+        if self.keys:
+            now = time.monotonic()
+            for k in range(16):
+                if self.keys & (1 << k) and self.release_at[k] <= now:
+                    self.keys &= ~(1 << k)
+        return first
 
-    def clear_screen(self):
-        self.screen_contents = set()
-        self.screen_redraw()
+    def wait_key(self):
+        self.draw_code_window()
+        curses.doupdate()
+        while True:
+            k = self.read_keys()
+            if k is not None:
+                return k
+            select.select([sys.stdin], [], []) # sleep until there is input
+
+    def wait_command(self, reason):
+        # a debugger stop, show why and wait for what to do next
+        self.show_status(reason)
+        self.draw_code_window()
+        curses.doupdate()
+        self.commands.clear()
+        while True:
+            k = self.read_keys()
+            if self.commands:
+                command = self.commands.popleft()
+                break
+            if k is not None:
+                command = 'step'
+                break
+            select.select([sys.stdin], [], [])
+        self.show_status("")
+        return command
+
+    def show_status(self, text):
+        # in the bottom border of the variable window
+        self.stdscr.addstr(self.var_y+VAR_H, self.var_x, text[:VAR_W].ljust(VAR_W, '─'))
 
-    def toggle_pixel(self, x, y):
-        self.screen_contents = self.screen_contents ^ {(x, y)}
+    def get_key(self, k):
+        return bool(self.keys & (1 << k))
 
-    def get_pixel(self, x, y):
-        return (x, y) in self.screen_contents
+    def update_code_window(self, pc=None, opcode=None):
+        # only remember what ran, text is produced when the window is drawn
+        self.code_contents.append(None if pc is None else (pc, opcode))
 
-    def update_code_window(self, pc=None, op=None):
-        if not pc or not op:
-            newline = " "*(CODE_W-1)
-        else:
-            newline = "0x{:04X}:{}{:>16}".format(pc, " "*(CODE_W-16-6-2-1), op)
-        self.code_contents.append(newline)
+    def code_line(self, entry):
+        if entry is None:
+            return " "*(CODE_W-1)
+        pc, opcode = entry
+        return "0x{:04X}:{}{:>16}".format(pc, " "*(CODE_W-16-6-2-1), self.disassemble(pc, opcode))
+
+    def draw_code_window(self):
         for i, line in enumerate(range(self.code_y, self.code_y+22)):
             try:
-                text = self.code_contents[i]
+                text = self.code_line(self.code_contents[i])
                 if "TERMINATION" in text:
-                    self.stdscr.addstr(line, self.code_x+1, self.code_contents[i], curses.color_pair(1))
+                    self.stdscr.addstr(line, self.code_x+1, text, curses.color_pair(1))
                 elif i == 21:
-                    self.stdscr.addstr(line, self.code_x+1, self.code_contents[i], curses.color_pair(2))
+                    self.stdscr.addstr(line, self.code_x+1, text, curses.color_pair(2))
                 else:
-                    self.stdscr.addstr(line, self.code_x+1, self.code_contents[i])
+                    self.stdscr.addstr(line, self.code_x+1, text)
             except IndexError:
                 self.stdscr.chgat(line-1, self.code_x+1, CODE_W-2, curses.color_pair(2))
                 break
-        self.stdscr.refresh()
+        self.stdscr.noutrefresh()
 
     def update_var_window(self, obj):
         self.stdscr.addstr(self.var_y, self.var_x+6, "0x{:04X}".format(obj.pc))
@@ -98,22 +176,28 @@ class CursesUI:
         for val, line in enumerate(range(self.var_y+2, self.var_y+10)):
             self.stdscr.addstr(line, self.var_x+6, "0x{:04X}".format(obj.v[val]))
             self.stdscr.addstr(line, self.var_x+int(VAR_W/2)+5, "0x{:04X}".format(obj.v[val+8]))
-        self.stdscr.refresh()
+        self.stdscr.noutrefresh()
 
-    def screen_redraw(self):
+    def screen_redraw(self, screen):
         if (self.height, self.width) != self.stdscr.getmaxyx():
             self.full_redraw()
-        for x in range(SCREEN_W):
-            for y in range(SCREEN_H):
-                pixel = '█' if (x, y) in self.screen_contents else ' '
-                self.stdscr.addstr(self.screen_y+y, self.screen_x+x, pixel, curses.color_pair(1))
-        self.stdscr.refresh()
-        key = self.stdscr.getch(self.var_y, self.var_x+VAR_W-1)
-        self.stdscr.addstr(self.var_y, self.var_x+VAR_W-1, " ")
-        self.lastpressed = key if key != -1 else self.lastpressed
+
+        # only emit what changed since the last presented frame
+        for y, row in enumerate(screen.rows):
+            diff = row ^ self.shown[y]
+            if not diff:
+                continue
+            pixels = format(row, '064b').translate(PIXELS)
+            for start, end in changed_runs(diff):
+                self.stdscr.addstr(self.screen_y+y, self.screen_x+start, pixels[start:end], curses.color_pair(1))
+            self.shown[y] = row
+
+        self.draw_code_window()
+        curses.doupdate()
 
     def full_redraw(self):
         self.stdscr.clear()
+        self.shown = [0] * SCREEN_H # the terminal is blank now, the next redraw paints every lit pixel
 
         # center screen
         self.height, self.width = self.stdscr.getmaxyx()
@@ -133,7 +217,7 @@ class CursesUI:
                           self.stdscr.derwin(VAR_H+2, VAR_W+2, self.var_y-1, self.var_x-1)
             for win in aux_wins:
                 win.border()
-                win.refresh()
+                win.noutrefresh()
             del aux_wins
         except curses.error:
             self.exit()
@@ -152,4 +236,165 @@ class CursesUI:
             self.stdscr.addstr(line, self.var_x+1, 'V{:X}:'.format(val))
             self.stdscr.addstr(line, self.var_x+int(VAR_W/2), 'V{:X}:'.format(val+8))
 
-        self.stdscr.refresh()
+        self.stdscr.noutrefresh()
+
+
+# everything the renderer needs of one emulated frame, it also stands in for
+# the machine and the framebuffer when handed to CursesUI
+Frame = namedtuple('Frame', 'rows pc i sp v code status')
+
+class ThreadedUI:
+    # same interface as CursesUI, but all terminal I/O happens on a render
+    # thread, the cpu only publishes immutable frames and reads the key state
+    # kept up to date by the renderer, so it never blocks on the terminal
+    def __init__(self, ui, refresh=REFRESH_RATE):
+        self.ui = ui
+        self.refresh = refresh
+        self.code_contents = deque([], CODE_H)
+        self.registers = (0, 0, 0, bytes(16))
+        self.rows = (0,) * SCREEN_H
+        self.status = ""
+        # the published frame, the cpu builds the next one aside and swaps
+        # it in with a single assignment, the renderer never sees a partial
+        # frame and never makes the cpu wait
+        self.front = None
+
+        self.pressed = threading.Condition()
+        self.presses = 0 # count of key presses, bumped by the renderer
+        self.last_press = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self.render, name='render', daemon=True)
+        self.thread.start()
+
+    @property
+    def disassemble(self):
+        return self.ui.disassemble
+
+    @disassemble.setter
+    def disassemble(self, disassemble):
+        self.ui.disassemble = disassemble
+
+    @property
+    def keys(self):
+        return self.ui.keys
+
+    @keys.setter
+    def keys(self, keys):
+        self.ui.keys = keys
+
+    def exit(self):
+        self.running = False
+        with self.pressed:
+            self.pressed.notify_all()
+        self.thread.join()
+        self.ui.exit()
+
+    def render(self):
+        period = 1 / self.refresh
+        deadline = time.monotonic()
+        shown = None
+        while self.running:
+            k = self.ui.poll()
+            if k is not None or self.ui.commands:
+                with self.pressed:
+                    if k is not None:
+                        self.last_press = k
+                        self.presses += 1
+                    self.pressed.notify_all()
+
+            frame = self.front
+            if frame is not shown:
+                self.ui.code_contents = frame.code
+                self.ui.show_status(frame.status)
+                self.ui.update_var_window(frame)
+                self.ui.screen_redraw(frame)
+                shown = frame
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else: # a slow terminal, skip the missed refreshes
+                deadline = time.monotonic()
+
+    def publish(self, rows=None):
+        if rows is not None:
+            self.rows = rows
+        pc, i, sp, v = self.registers
+        self.front = Frame(self.rows, pc, i, sp, v, tuple(self.code_contents), self.status)
+
+    def wait_key(self):
+        # show where we are waiting, then sleep until the renderer sees a press
+        self.publish()
+        with self.pressed:
+            presses = self.presses
+            self.pressed.wait_for(lambda: self.presses != presses or not self.running)
+            return self.last_press
+
+    def wait_command(self, reason):
+        self.status = reason
+        self.ui.commands.clear()
+        self.publish()
+        with self.pressed:
+            presses = self.presses
+            self.pressed.wait_for(lambda: self.presses != presses or self.ui.commands or not self.running)
+        self.status = ""
+        self.publish()
+        return self.ui.commands.popleft() if self.ui.commands else 'step'
+
+    def get_key(self, k):
+        return bool(self.ui.keys & (1 << k))
+
+    def poll(self):
+        pass # input belongs to the render thread
+
+    def update_code_window(self, pc=None, opcode=None):
+        self.code_contents.append(None if pc is None else (pc, opcode))
+
+    def update_var_window(self, obj):
+        self.registers = (obj.pc, obj.i, obj.sp, bytes(obj.v))
+
+    def screen_redraw(self, screen):
+        self.publish(tuple(screen.rows))
+
+
+class NullUI:
+    # same interface as CursesUI, but without any terminal I/O, the display
+    # itself lives in the emulator's framebuffer
+    def __init__(self):
+        self.keys = 0 # bitmask of currently pressed keys, bit k is key k
+
+    def exit(self):
+        pass
+
+    def press(self, k):
+        self.keys |= 1 << k
+
+    def release(self, k):
+        self.keys &= ~(1 << k)
+
+    def wait_key(self):
+        # nothing to wait on, take the lowest pressed key if any
+        for k in range(16):
+            if self.keys & (1 << k):
+                return k
+        return 0
+
+    def wait_command(self, reason):
+        return 'continue' # nobody to ask
+
+    def get_key(self, k):
+        return bool(self.keys & (1 << k))
+
+    def poll(self):
+        pass
+
+    def update_code_window(self, pc=None, opcode=None):
+        pass
+
+    def update_var_window(self, obj):
+        pass
+
+    def screen_redraw(self, screen):
+        pass
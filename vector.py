@@ -0,0 +1,290 @@
+import random
+
+import numpy as np
+
+from emu import Chip8, FONT, IPF, MEMORY_SIZE, PROGRAM_START
+
+RUNNING, TERMINATED, ERROR = 0, 1, 2
+
+# handler names in a fixed order, the opcode table maps every opcode to one
+# of them, index 0 stands for opcodes without a handler
+NAMES = ['terminate'] + sorted({op_func.__name__ for _, op_func in Chip8.op_map.values()})
+KINDS = np.array([NAMES.index(op_func.__name__) if op_func else 0 for op_func, _ in Chip8.decode_table],
+                 dtype=np.uint8)
+
+class VectorChip8:
+    # n machines running one ROM in lockstep, with all state held in numpy
+    # arrays, every step groups the machines by decoded instruction and runs
+    # each group as array operations, semantics follow the handlers in emu.py
+    # on a NullUI, machines that would raise an exception there are halted
+    # with an ERROR status instead
+    def __init__(self, rom, n, seeds=None, ipf=IPF):
+        if isinstance(rom, str): # a filename, otherwise the ROM contents
+            with open(rom, 'rb') as f:
+                rom = f.read()
+        self.rom = np.frombuffer(bytes(rom[:MEMORY_SIZE-PROGRAM_START]), dtype=np.uint8)
+        self.n = n
+        self.ipf = ipf
+        self.handlers = [getattr(self, name) for name in NAMES]
+
+        self.memory = np.zeros((n, MEMORY_SIZE), dtype=np.uint8)
+        self.v = np.zeros((n, 16), dtype=np.uint8)
+        self.stack = np.zeros((n, 16), dtype=np.int64)
+        self.pc = np.zeros(n, dtype=np.int64)
+        self.opcode = np.zeros(n, dtype=np.int64)
+        self.sp = np.zeros(n, dtype=np.int64)
+        self.i = np.zeros(n, dtype=np.int64)
+        self.delay_timer = np.zeros(n, dtype=np.int64)
+        self.sound_timer = np.zeros(n, dtype=np.int64)
+        self.cycles = np.zeros(n, dtype=np.int64)
+        self.status = np.zeros(n, dtype=np.uint8)
+        self.keys = np.zeros(n, dtype=np.int64) # bitmask of pressed keys, like NullUI
+        self.screen = np.zeros((n, 32), dtype=np.uint64) # rows as in framebuffer.py
+        self.reset(seeds)
+
+    def reset(self, seeds=None):
+        if seeds is None:
+            seeds = [None] * self.n
+        self.rngs = [random.Random(seed) for seed in seeds]
+        self.memory[:] = 0
+        self.memory[:, :len(FONT)] = np.frombuffer(FONT, dtype=np.uint8)
+        self.memory[:, PROGRAM_START:PROGRAM_START+len(self.rom)] = self.rom
+        for array in (self.v, self.stack, self.opcode, self.sp, self.i, self.delay_timer,
+                      self.sound_timer, self.cycles, self.status, self.keys, self.screen):
+            array[:] = 0
+        self.pc[:] = PROGRAM_START
+
+    def pixels(self):
+        # the screens unpacked to an (n, 32, 64) bool array
+        rows = self.screen.astype('>u8').view(np.uint8).reshape(self.n, 32, 8)
+        return np.unpackbits(rows, axis=2).astype(bool)
+
+    def step(self):
+        active = np.flatnonzero(self.status == RUNNING)
+        if not active.size:
+            return False
+
+        # fetch, running past the end of memory is an error
+        pc = self.pc[active]
+        self.pc[active] = pc + 2
+        fetchable = pc + 1 < MEMORY_SIZE
+        self.halt(active[~fetchable], ERROR)
+        active = active[fetchable]
+        pc = pc[fetchable]
+        op = self.memory[active, pc].astype(np.int64) << 8 | self.memory[active, pc+1]
+        self.opcode[active] = op
+
+        # decode into groups and execute
+        kinds = KINDS[op]
+        for kind in np.unique(kinds):
+            group = kinds == kind
+            self.handlers[kind](active[group], op[group])
+
+        done = active[self.status[active] == RUNNING]
+        self.cycles[done] += 1
+        return True
+
+    def tick(self):
+        running = self.status == RUNNING
+        self.delay_timer[running & (self.delay_timer > 0)] -= 1
+        self.sound_timer[running & (self.sound_timer > 0)] -= 1
+
+    def frame(self):
+        for _ in range(self.ipf):
+            if not self.step():
+                return False
+        self.tick()
+        return True
+
+    def run(self, frames):
+        for _ in range(frames):
+            if not self.frame():
+                return False
+        return True
+
+    def halt(self, sel, status):
+        self.status[sel] = status
+
+    def checked(self, sel, ok):
+        # halt the machines where ok is False, return the rest
+        self.halt(sel[~ok], ERROR)
+        return sel[ok]
+
+    def terminate(self, sel, op):
+        self.halt(sel, TERMINATED)
+
+    def clear_screen(self, sel, op): # 0x00e0 cls
+        self.screen[sel] = 0
+
+    def return_from_subroutine(self, sel, op): # 0x00ee rts
+        sp = self.sp[sel] - 1
+        self.sp[sel] = sp
+        ok = sp >= -16 # negative indices wrap around, as with a python array
+        sel, sp = self.checked(sel, ok), sp[ok]
+        self.pc[sel] = self.stack[sel, sp]
+
+    def jump(self, sel, op): # 0x1NNN jmp NNN
+        self.pc[sel] = op & 0x0fff
+
+    def jump_to_subroutine(self, sel, op): # 0x2NNN jsr NNN
+        sp = self.sp[sel]
+        ok = (sp >= -16) & (sp < 16)
+        sel, sp, op = self.checked(sel, ok), sp[ok], op[ok]
+        self.stack[sel, sp] = self.pc[sel]
+        self.sp[sel] = sp + 1
+        self.pc[sel] = op & 0x0fff
+
+    def skip_if(self, sel, condition):
+        self.pc[sel[condition]] += 2
+
+    def skip_next_eq_const(self, sel, op): # 0x3XRR skeq VX,RR
+        self.skip_if(sel, self.v[sel, (op >> 8) & 0xf] == (op & 0xff))
+
+    def skip_next_ne_const(self, sel, op): # 0x4XRR skne VX,RR
+        self.skip_if(sel, self.v[sel, (op >> 8) & 0xf] != (op & 0xff))
+
+    def skip_next_eq_reg(self, sel, op): # 0x5XY0 skeq VX,VY
+        self.skip_if(sel, self.v[sel, (op >> 8) & 0xf] == self.v[sel, (op >> 4) & 0xf])
+
+    def load_const(self, sel, op): # 0x6XRR mov VX,RR
+        self.v[sel, (op >> 8) & 0xf] = op & 0xff
+
+    def add_const(self, sel, op): # 0x7XRR add VX,RR
+        x = (op >> 8) & 0xf
+        self.v[sel, x] = (self.v[sel, x] + (op & 0xff)) & 0xff
+
+    def load_reg(self, sel, op): # 0x8XY0 mov VX,VY
+        self.v[sel, (op >> 8) & 0xf] = self.v[sel, (op >> 4) & 0xf]
+
+    def or_reg(self, sel, op): # 0x8XY1 or VX,VY
+        x = (op >> 8) & 0xf
+        self.v[sel, x] = self.v[sel, x] | self.v[sel, (op >> 4) & 0xf]
+
+    def and_reg(self, sel, op): # 0x8XY2 and VX,VY
+        x = (op >> 8) & 0xf
+        self.v[sel, x] = self.v[sel, x] & self.v[sel, (op >> 4) & 0xf]
+
+    def xor_reg(self, sel, op): # 0x8XY3 xor VX,VY
+        x = (op >> 8) & 0xf
+        self.v[sel, x] = self.v[sel, x] ^ self.v[sel, (op >> 4) & 0xf]
+
+    def add_reg(self, sel, op): # 0x8XY4 add VX,VY
+        x = (op >> 8) & 0xf
+        result = self.v[sel, x].astype(np.int64) + self.v[sel, (op >> 4) & 0xf]
+        self.v[sel, 0xf] = result >> 8
+        self.v[sel, x] = result & 0xff
+
+    def sub_reg(self, sel, op): # 0x8XY5 sub VX,VY
+        x = (op >> 8) & 0xf
+        vx = self.v[sel, x].astype(np.int64)
+        vy = self.v[sel, (op >> 4) & 0xf].astype(np.int64)
+        self.v[sel, 0xf] = vx > vy
+        self.v[sel, x] = (vx - vy) & 0xff
+
+    def shift_right(self, sel, op): # 0x8X06 shr VX
+        x = (op >> 8) & 0xf
+        self.v[sel, 0xf] = self.v[sel, x] & 1
+        self.v[sel, x] = self.v[sel, x] >> 1
+
+    def shift_left(self, sel, op): # 0x8X0e shl VX
+        x = (op >> 8) & 0xf
+        self.v[sel, 0xf] = self.v[sel, x] >> 7
+        self.v[sel, x] = (self.v[sel, x].astype(np.int64) << 1) & 0xff
+
+    def sub_reg_reverse(self, sel, op): # 0x8XY7 rsb VX,VY
+        x = (op >> 8) & 0xf
+        vx = self.v[sel, x].astype(np.int64)
+        vy = self.v[sel, (op >> 4) & 0xf].astype(np.int64)
+        self.v[sel, 0xf] = vy > vx
+        self.v[sel, x] = (vy - vx) & 0xff
+
+    def skip_next_ne_reg(self, sel, op): # 0x9XY0 skne VX,VY
+        self.skip_if(sel, self.v[sel, (op >> 8) & 0xf] != self.v[sel, (op >> 4) & 0xf])
+
+    def load_const_i(self, sel, op): # 0xaNNN mvi NNN
+        self.i[sel] = op & 0x0fff
+
+    def jump_i(self, sel, op): # 0xbNNN jmi NNN
+        self.pc[sel] = (op & 0x0fff) + self.v[sel, 0]
+
+    def load_random(self, sel, op): # 0xcXKK rand VX,KK
+        # drawn machine by machine, so every machine keeps its own sequence
+        x = (op >> 8) & 0xf
+        values = [self.rngs[m].randint(0, 2**15) for m in sel.tolist()]
+        self.v[sel, x] = np.array(values, dtype=np.int64) & (op & 0xff)
+
+    def draw_sprite(self, sel, op): # 0xdXYN sprite VX,VY,N (n = 0 -> 16)
+        x = self.v[sel, (op >> 8) & 0xf].astype(np.int64) % 64
+        y = self.v[sel, (op >> 4) & 0xf].astype(np.int64) % 32
+        n = op & 0xf
+        rows = np.where(n == 0, 16, n)
+        i = self.i[sel]
+        collision = np.zeros(len(sel), dtype=bool)
+        for line in range(16):
+            # sprite rows past the end of memory or the screen are dropped
+            draw = (line < rows) & (i + line < MEMORY_SIZE) & (y + line < 32)
+            if not draw.any():
+                break
+            m, row = sel[draw], y[draw] + line
+            sprite = self.memory[m, i[draw] + line].astype(np.uint64)
+            bits = (sprite << np.uint64(56)) >> x[draw].astype(np.uint64)
+            old = self.screen[m, row]
+            collision[draw] |= (old & bits) != 0
+            self.screen[m, row] = old ^ bits
+        self.v[sel, 0xf] = collision
+
+    def skip_keydown(self, sel, op): # 0xeK9e skpr K
+        self.skip_if(sel, self.key_down(sel, op))
+
+    def skip_keyup(self, sel, op): # 0xeKa1 skup K
+        self.skip_if(sel, ~self.key_down(sel, op))
+
+    def key_down(self, sel, op):
+        k = self.v[sel, (op >> 8) & 0xf].astype(np.int64)
+        return (k < 16) & (((self.keys[sel] >> np.minimum(k, 15)) & 1) == 1)
+
+    def get_delay(self, sel, op): # 0xfR07 gdelay VR
+        self.v[sel, (op >> 8) & 0xf] = self.delay_timer[sel]
+
+    def wait_key(self, sel, op): # 0xfR0a key VR
+        # the lowest pressed key, or 0 if there is none, as NullUI does
+        keys = self.keys[sel]
+        lowest = keys & -keys
+        self.v[sel, (op >> 8) & 0xf] = np.where(lowest > 0, np.log2(np.maximum(lowest, 1)).astype(np.int64), 0)
+
+    def set_delay_timer(self, sel, op): # 0xfR15 sdelay VR
+        self.delay_timer[sel] = self.v[sel, (op >> 8) & 0xf]
+
+    def set_sound_timer(self, sel, op): # 0xfR18 ssound VR
+        self.sound_timer[sel] = self.v[sel, (op >> 8) & 0xf]
+
+    def add_to_i(self, sel, op): # 0xfR1e adi VR
+        self.i[sel] = self.i[sel] + self.v[sel, (op >> 8) & 0xf]
+
+    def set_char(self, sel, op): # 0xfR29 font VR
+        self.i[sel] = self.v[sel, (op >> 8) & 0xf].astype(np.int64) * 5
+
+    def put_bcd(self, sel, op): # 0xfR33 bcd VR
+        ok = self.i[sel] + 2 < MEMORY_SIZE
+        sel, op = self.checked(sel, ok), op[ok]
+        r = self.v[sel, (op >> 8) & 0xf]
+        i = self.i[sel]
+        self.memory[sel, i] = r // 100
+        self.memory[sel, i+1] = (r // 10) % 10
+        self.memory[sel, i+2] = r % 10
+
+    def store_reg_to_mem(self, sel, op): # 0xfR55 str V0-VR
+        x = (op >> 8) & 0xf
+        ok = self.i[sel] + x < MEMORY_SIZE
+        sel, x = self.checked(sel, ok), x[ok]
+        for reg in range(16):
+            m = sel[reg <= x]
+            self.memory[m, self.i[m] + reg] = self.v[m, reg]
+
+    def load_reg_from_mem(self, sel, op): # 0xfR65 ldr V0-VR
+        x = (op >> 8) & 0xf
+        ok = self.i[sel] + x < MEMORY_SIZE
+        sel, x = self.checked(sel, ok), x[ok]
+        for reg in range(16):
+            m = sel[reg <= x]
+            self.v[m, reg] = self.memory[m, self.i[m] + reg]